@@ -0,0 +1,153 @@
+import asyncio
+import httpx
+from closeio_api import APIError, ValidationError
+from config import Config
+from transport import TokenBucket, backoff_delay, rate_limit_wait
+from metrics import API_REQUEST_SECONDS, API_RESPONSES, API_RETRIES, endpoint_label, timed
+
+CLOSE_BASE_URL = 'https://api.close.com/api/v1/'
+
+
+class AsyncCloseClient:
+    """
+    Асинхронный клиент Close API на httpx.
+    Держит пул keep-alive соединений, применяет реальный таймаут к каждому запросу
+    и те же правила ограничения скорости и повторов, что и transport.RateLimitedClient.
+    Используется как асинхронный контекстный менеджер:
+
+        async with AsyncCloseClient(api_key) as client:
+            resp = await client.search_leads(query)
+    """
+
+    RETRY_STATUSES = (503,)
+    RETRY_GET_STATUSES = (500, 502, 503, 504)
+    # Ошибки до отправки запроса: только их можно повторять для изменяющих запросов
+    NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def __init__(self, api_key, base_url=None, bucket=None, timeout=None,
+                 max_connections=None, max_attempts=None, transport=None, sleep=asyncio.sleep):
+        self.api_key = api_key
+        self.base_url = base_url or CLOSE_BASE_URL
+        self.bucket = bucket or TokenBucket(Config.RATE_LIMIT_RPS, Config.RATE_LIMIT_BURST)
+        self.timeout = timeout or Config.API_TIMEOUT
+        self.max_connections = max_connections or Config.ASYNC_MAX_CONNECTIONS
+        self.max_attempts = max_attempts or Config.MAX_RETRIES
+        self.transport = transport
+        self.sleep = sleep
+        self._client = None
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            auth=(self.api_key, ''),
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections,
+                                max_keepalive_connections=self.max_connections),
+            transport=self.transport,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _acquire(self):
+        while True:
+            wait = self.bucket.try_acquire()
+            if not wait:
+                return
+            await self.sleep(wait)
+
+    async def request(self, method, endpoint, params=None, data=None):
+        """Выполняет запрос с ограничением скорости и повторами, возвращает JSON ответа"""
+        if self._client is None:
+            raise RuntimeError("AsyncCloseClient используется вне async with")
+        if not endpoint.endswith('/'):
+            endpoint += '/'
+
+        retry_statuses = self.RETRY_GET_STATUSES if method == 'get' else self.RETRY_STATUSES
+        label = endpoint_label(endpoint)
+        attempt = 0
+        while True:
+            await self._acquire()
+            try:
+                with timed(API_REQUEST_SECONDS, method=method, endpoint=label):
+                    response = await self._client.request(method, endpoint, params=params, json=data)
+            except httpx.TransportError as e:
+                attempt += 1
+                if attempt >= self.max_attempts or (method != 'get' and not isinstance(e, self.NOT_SENT_ERRORS)):
+                    raise
+                API_RETRIES.inc(endpoint=label, reason=type(e).__name__)
+                await self.sleep(backoff_delay(attempt - 1))
+                continue
+            API_RESPONSES.inc(endpoint=label, status=response.status_code)
+
+            wait = rate_limit_wait(response)
+            if wait is not None:
+                self.bucket.pause(wait)
+
+            if response.status_code == 429 or response.status_code in retry_statuses:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    break
+                API_RETRIES.inc(endpoint=label, reason=response.status_code)
+                if response.status_code != 429:
+                    await self.sleep(backoff_delay(attempt - 1))
+                continue
+            break
+
+        if response.is_success:
+            if response.status_code == 204:
+                return ''
+            return response.json()
+        elif response.status_code == 400:
+            raise ValidationError(response)
+        else:
+            raise APIError(response)
+
+    async def get(self, endpoint, params=None):
+        return await self.request('get', endpoint, params=params)
+
+    async def post(self, endpoint, data=None):
+        return await self.request('post', endpoint, data=data)
+
+    async def search_leads(self, query):
+        """Поиск лидов с подсчетом количества"""
+        return await self.post('data/search', data=dict(query, include_counts=True))
+
+    async def subscribe_sequence(self, data):
+        """Подписка на цепочку (bulk action)"""
+        return await self.post('bulk_action/sequence_subscription', data=data)
+
+    async def iter_pages(self, endpoint, params=None):
+        """Асинхронно обходит все страницы списка Close API"""
+        params = dict(params or {})
+        skip = 0
+        while True:
+            resp = await self.get(endpoint, params=dict(params, _skip=skip, _limit=Config.PAGE_LIMIT))
+            data = resp.get('data', [])
+            for item in data:
+                yield item
+            if not resp.get('has_more') or not data:
+                break
+            skip += len(data)
+
+    def iter_sequences(self):
+        """Асинхронно обходит все цепочки"""
+        return self.iter_pages('sequence')
+
+    def iter_connected_accounts(self):
+        """Асинхронно обходит все подключенные почтовые ящики"""
+        return self.iter_pages('connected_account')
+
+    def iter_users(self):
+        """Асинхронно обходит всех пользователей"""
+        return self.iter_pages('user')
+
+    async def collect(self, endpoint):
+        """Все элементы списка одним списком"""
+        return [item async for item in self.iter_pages(endpoint)]
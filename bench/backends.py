@@ -0,0 +1,292 @@
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import Counter
+from urllib.parse import urlsplit, parse_qsl
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+from metrics import endpoint_label
+
+API_PREFIX = '/api/v1/'
+
+
+class CloseBackend:
+    """
+    Имитация Close API в памяти: списки с пагинацией, поиск лидов, подписка на цепочку
+    и статус созданной подписки (bulk action сразу завершена).
+    Задержка, размер страницы, доля ошибок 500 и ответов 429 настраиваются,
+    все обращения считаются по методу и эндпоинту. Остальные ответы, как и у Close,
+    несут заголовки RateLimit с оставшейся квотой.
+    """
+
+    def __init__(self, sequences, accounts, users, latency=0.0, max_page_size=100,
+                 error_rate=0.0, rate_limit_rate=0.0, retry_after=1, quota=1000, total_results=True, seed=0):
+        self.lists = {
+            'sequence': list(sequences),
+            'connected_account': list(accounts),
+            'user': list(users),
+        }
+        self.accounts = {account['id']: account for account in accounts}
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.quota = quota
+        self.total_results = total_results
+        self.calls = Counter()
+        self.statuses = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bulk_ids = 0
+        self.bulk_actions = {}
+
+    def _inject(self):
+        """Случайный отказ: 429 или 500 согласно настроенным долям"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429, {'Retry-After': str(self.retry_after)}, {'error': 'Too many requests'}
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500, {}, {'error': 'Internal server error'}
+        return None
+
+    def handle(self, method, path, params=None, body=None):
+        """
+        Обрабатывает запрос
+        :param method: 'get' или 'post'
+        :param path: эндпоинт без префикса /api/v1/, например 'sequence/'
+        :param params: параметры строки запроса
+        :param body: тело запроса (dict) или None
+        :return: кортеж (статус, заголовки, JSON ответа)
+        """
+        method = method.lower()
+        endpoint = path.strip('/')
+        with self._lock:
+            self.calls[(method, endpoint_label(endpoint))] += 1
+
+        status, headers, payload = self._inject() or self._route(method, endpoint, params or {}, body or {})
+        with self._lock:
+            self.statuses[status] += 1
+            calls = sum(self.calls.values())
+        if status != 429:
+            # Квота не исчерпана: клиент не должен делать паузу до сброса
+            remaining = self.quota - calls % self.quota
+            headers = dict(headers, **{'RateLimit': f"limit={self.quota}, remaining={remaining}, reset=7",
+                                       'RateLimit-Reset': '7'})
+        return status, headers, payload
+
+    def _route(self, method, endpoint, params, body):
+        if method == 'get' and endpoint in self.lists:
+            return 200, {}, self._page(self.lists[endpoint], params)
+        if method == 'post' and endpoint == 'data/search':
+            return 200, {}, self._search(body)
+        if method == 'post' and endpoint == 'bulk_action/sequence_subscription':
+            return self._subscribe(body)
+        if method == 'get' and endpoint.startswith('bulk_action/sequence_subscription/'):
+            bulk = self.bulk_actions.get(endpoint.rsplit('/', 1)[1])
+            if bulk is not None:
+                return 200, {}, bulk
+        return 404, {}, {'error': f'Unknown endpoint: {endpoint}'}
+
+    def _page(self, items, params):
+        skip = int(params.get('_skip', 0))
+        limit = min(int(params.get('_limit', self.max_page_size)), self.max_page_size)
+        data = items[skip:skip + limit]
+        page = {'data': data, 'has_more': skip + len(data) < len(items)}
+        if self.total_results:
+            page['total_results'] = len(items)
+        return page
+
+    def _search(self, body):
+        # Количество лидов детерминировано содержимым запроса
+        total = sum(json.dumps(body.get('query'), sort_keys=True).encode('utf-8')) % 500
+        return {'data': [], 'cursor': None, 'count': {'total': total}}
+
+    def _subscribe(self, body):
+        account = self.accounts.get(body.get('sender_account_id'))
+        if account is None:
+            return 400, {}, {'error': 'Connected account does not exist'}
+        identities = {item.get('email', '').lower() for item in account.get('identities') or []}
+        if body.get('sender_email', '').lower() not in identities:
+            return 400, {}, {'error': 'identity does not exist'}
+        # Задача сразу считается выполненной: все лиды поиска подписаны
+        n_objects = min(self._search({'query': body.get('s_query')})['count']['total'], body.get('results_limit') or 0)
+        with self._lock:
+            self._bulk_ids += 1
+            bulk_id = f"bulksubscr_{self._bulk_ids:022d}"
+            self.bulk_actions[bulk_id] = {'id': bulk_id, 'status': 'completed',
+                                          'n_objects': n_objects, 'n_objects_processed': n_objects}
+        return 200, {}, {'id': bulk_id, 'status': 'created'}
+
+    def _split(self, url):
+        parts = urlsplit(url)
+        path = parts.path
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        return path, dict(parse_qsl(parts.query))
+
+    def session(self):
+        """Сессия requests, отвечающая от имени этого бэкенда (для RateLimitedClient)"""
+        return FakeCloseSession(self)
+
+    def async_transport(self):
+        """Транспорт httpx, отвечающий от имени этого бэкенда (для AsyncCloseClient)"""
+        async def handler(request):
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            path, params = self._split(str(request.url))
+            body = json.loads(request.content) if request.content else None
+            status, headers, payload = self.handle(request.method, path, params, body)
+            return httpx.Response(status, headers=headers, json=payload)
+        return httpx.MockTransport(handler)
+
+
+class FakeCloseSession(requests.Session):
+    """requests.Session, которая не ходит в сеть, а передает подготовленный запрос в CloseBackend"""
+
+    def __init__(self, backend):
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request, **kwargs):
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        path, params = self.backend._split(request.url)
+        body = json.loads(request.body) if request.body else None
+        status, headers, payload = self.backend.handle(request.method, path, params, body)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(dict(headers, **{'Content-Type': 'application/json'}))
+        response._content = json.dumps(payload).encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+
+class SheetsBackend:
+    """
+    Имитация Google Sheets в памяти: таблицы -> листы -> значения, с задержкой и счетчиком вызовов.
+    Время изменения таблицы (modifiedTime в Drive) - номер последней записи в нее
+    """
+
+    def __init__(self, spreadsheets, latency=0.0):
+        self.spreadsheets = {name: {title: [list(row) for row in values] for title, values in sheets.items()}
+                             for name, sheets in spreadsheets.items()}
+        self.latency = latency
+        self.calls = Counter()
+        self.revisions = Counter()
+        self.row_counts = {}  # (таблица, лист) -> строк сетки после resize
+        self._lock = threading.Lock()
+
+    def touch(self, spreadsheet):
+        with self._lock:
+            self.revisions[spreadsheet] += 1
+
+    def modified_time(self, spreadsheet):
+        with self._lock:
+            return f"2024-01-01T00:00:00.{self.revisions[spreadsheet]:06d}Z"
+
+    def call(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def client(self):
+        """Клиент с интерфейсом gspread.Client (open по названию)"""
+        return FakeGspreadClient(self)
+
+
+class FakeGspreadClient:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open(self, title):
+        self.backend.call('open')
+        if title not in self.backend.spreadsheets:
+            raise KeyError(f"Spreadsheet not found: {title}")
+        return FakeSpreadsheet(self.backend, title)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend, title):
+        self.backend = backend
+        self.title = title
+        self.id = f"spreadsheet-{title}"
+        self.sheets = backend.spreadsheets[title]
+
+    def get_lastUpdateTime(self):
+        self.backend.call('drive_get_metadata')
+        return self.backend.modified_time(self.title)
+
+    def worksheets(self):
+        self.backend.call('fetch_sheet_metadata')
+        return [FakeWorksheet(self, title) for title in self.sheets]
+
+    def worksheet(self, title):
+        from gspread.exceptions import WorksheetNotFound
+
+        self.backend.call('fetch_sheet_metadata')
+        if title not in self.sheets:
+            raise WorksheetNotFound(title)
+        return FakeWorksheet(self, title)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        self.backend.call('add_worksheet')
+        self.sheets[title] = []
+        self.backend.touch(self.title)
+        return FakeWorksheet(self, title)
+
+    def values_batch_get(self, ranges, params=None):
+        self.backend.call('values_batch_get')
+        value_ranges = []
+        for range_name in ranges:
+            title = range_name.rsplit('!', 1)[0]
+            if title.startswith("'") and title.endswith("'"):
+                title = title[1:-1].replace("''", "'")
+            value_ranges.append({'range': range_name, 'values': [list(row) for row in self.sheets.get(title, [])]})
+        return {'spreadsheetId': self.title, 'valueRanges': value_ranges}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title):
+        self.spreadsheet = spreadsheet
+        self.backend = spreadsheet.backend
+        self.sheets = spreadsheet.sheets
+        self.title = title
+        self.id = list(self.sheets).index(title)
+
+    def _write(self, operation):
+        self.backend.call(operation)
+        self.backend.touch(self.spreadsheet.title)
+
+    def get(self, range_name=None, **kwargs):
+        self.backend.call('values_get')
+        return [list(row) for row in self.sheets[self.title]]
+
+    def append_rows(self, values, **kwargs):
+        self._write('values_append')
+        self.sheets[self.title].extend(list(row) for row in values)
+
+    @property
+    def row_count(self):
+        return self.backend.row_counts.get((self.spreadsheet.title, self.title), 1000)
+
+    def clear(self):
+        self._write('values_clear')
+        self.sheets[self.title] = []
+
+    def resize(self, rows=None, cols=None):
+        self._write('resize')
+        if rows is not None:
+            self.backend.row_counts[(self.spreadsheet.title, self.title)] = rows
+
+    def update(self, values, range_name=None, **kwargs):
+        self._write('values_update')
+        self.sheets[self.title] = [list(row) for row in values]
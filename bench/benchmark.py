@@ -0,0 +1,319 @@
+"""
+Офлайн-бенчмарк энроллинга на фейковых Close и Google Sheets.
+
+    python -m bench.benchmark --workload ci
+    python -m bench.benchmark --workload realistic --output bench_output.json
+    python -m bench.benchmark --workload ci --baseline bench/baseline_ci.json
+
+Паузы между подписками, ожидания token bucket и задержки повторов идут по виртуальным часам,
+реальное время тратится только на код энроллинга и заданную задержку бэкендов.
+С --baseline сравнивает число обращений к Close, чтений Sheets и пауз по заголовкам квоты
+с сохраненным и завершается с кодом 1, если оно выросло больше допуска.
+"""
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+from dataclasses import dataclass, asdict, replace
+from config import Config
+from metrics import registry, PHASE_SECONDS, SUBSCRIPTIONS, PACING_SECONDS
+from services import ServiceContainer, set_services
+from transport import TokenBucket, RateLimitedClient
+from async_client import AsyncCloseClient
+from schedule_spec import CronSpec
+from bench.backends import CloseBackend, SheetsBackend
+
+
+@dataclass(frozen=True)
+class Workload:
+    """Параметры нагрузки"""
+    name: str
+    sheets: int
+    rows: int
+    sequences: int
+    mailboxes: int
+    unique_filters: int
+    broken_mailbox_rate: float = 0.05  # ящики без identity, подписка падает с ошибкой
+    unknown_mailbox_rate: float = 0.02  # строки с ящиком, которого нет в Close
+    close_latency: float = 0.0  # секунд на запрос к Close
+    sheets_latency: float = 0.0  # секунд на запрос к Sheets
+    page_size: int = 100  # максимальный размер страницы списков Close
+    error_rate: float = 0.0  # доля ответов 500
+    rate_limit_rate: float = 0.0  # доля ответов 429
+    seed: int = 0
+
+
+SHEETS_READ_OPS = ('open', 'drive_get_metadata', 'values_get', 'values_batch_get')
+
+WORKLOADS = {
+    'ci': Workload('ci', sheets=5, rows=200, sequences=150, mailboxes=20, unique_filters=40),
+    'realistic': Workload('realistic', sheets=50, rows=5000, sequences=2000, mailboxes=200, unique_filters=500,
+                          close_latency=0.002, sheets_latency=0.05, error_rate=0.01, rate_limit_rate=0.01),
+}
+
+
+class VirtualClock:
+    """Виртуальные часы: sleep не ждет, а сдвигает время вперед"""
+
+    def __init__(self):
+        self._now = 0.0
+        self.slept = 0.0
+        self._lock = threading.Lock()
+
+    def now(self):
+        with self._lock:
+            return self._now
+
+    def sleep(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+            self.slept += max(0.0, seconds)
+
+    async def async_sleep(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+def build_workload(workload):
+    """
+    Генерирует данные нагрузки
+    :return: кортеж (листы таблицы, цепочки, ящики, пользователи)
+    """
+    rnd = random.Random(workload.seed)
+    users = [{'id': f"user_{i:020d}", 'first_name': 'User', 'last_name': str(i)} for i in range(max(1, workload.mailboxes // 4))]
+    sequences = [{'id': f"seq_{i:020d}", 'name': f"Bench sequence {i}"} for i in range(workload.sequences)]
+
+    accounts = []
+    for i in range(workload.mailboxes):
+        email = f"sender{i}@bench.example"
+        broken = rnd.random() < workload.broken_mailbox_rate
+        accounts.append({
+            'id': f"emailacct_{i:020d}",
+            'email': email,
+            'send_status': 'ok',
+            'user_id': users[i % len(users)]['id'],
+            'identities': [] if broken else [{'email': email, 'name': f"Sender {i}"}],
+        })
+
+    filters = [json.dumps({
+        'query': {'type': 'and', 'queries': [{'type': 'object_type', 'object_type': 'lead'},
+                                             {'type': 'text', 'value': f"segment {i}"}]},
+        'sort': [],
+        'results_limit': 100 + i,
+    }) for i in range(workload.unique_filters)]
+
+    sheets = {}
+    per_sheet = [workload.rows // workload.sheets + (1 if i < workload.rows % workload.sheets else 0)
+                 for i in range(workload.sheets)]
+    for i, count in enumerate(per_sheet):
+        seq_name = rnd.choice(sequences)['name']
+        values = [[seq_name], [], ['email', 'url', 'filters_json']]
+        for j in range(count):
+            if rnd.random() < workload.unknown_mailbox_rate:
+                email = f"unknown{j}@bench.example"
+            else:
+                email = rnd.choice(accounts)['email']
+            values.append([email, f"https://app.close.com/smartview/bench_{i}_{j}/", rnd.choice(filters)])
+        sheets[f"{Config.SHEET_PREFIX}bench_{i}"] = values
+    sheets['enrolling_pyReport'] = []
+    sheets['error_accts'] = []
+    return sheets, sequences, accounts, users
+
+
+@contextlib.contextmanager
+def patched_config(**values):
+    """Временно переопределяет атрибуты Config"""
+    previous = {name: getattr(Config, name) for name in values}
+    for name, value in values.items():
+        setattr(Config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(Config, name, value)
+
+
+class CountingBucket(TokenBucket):
+    """Token bucket, считающий паузы по ответам Close (429 или исчерпанная квота)"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pauses = 0
+
+    def pause(self, seconds):
+        self.pauses += 1
+        super().pause(seconds)
+
+
+def run_benchmark(workload, async_startup=True, verbose=False):
+    """
+    Прогоняет нагрузку через EnrollProcessor.process_enrollment
+    :return: словарь с результатами
+    """
+    import functions
+    from enroll_processor import EnrollProcessor
+
+    sheets, sequences, accounts, users = build_workload(workload)
+    close = CloseBackend(sequences, accounts, users, latency=workload.close_latency,
+                         max_page_size=workload.page_size, error_rate=workload.error_rate,
+                         rate_limit_rate=workload.rate_limit_rate, seed=workload.seed)
+    spreadsheets = SheetsBackend({Config.SPREAD_NAME: sheets}, latency=workload.sheets_latency)
+
+    clock = VirtualClock()
+    bucket = CountingBucket(Config.RATE_LIMIT_RPS, Config.RATE_LIMIT_BURST, clock=clock.now, sleep=clock.sleep)
+    api = RateLimitedClient('bench', bucket=bucket, sleep=clock.sleep)
+    api.session = close.session()
+    api.session.auth = ('bench', '')
+    container = ServiceContainer(
+        gc=spreadsheets.client(),
+        api=api,
+        async_api_factory=lambda: AsyncCloseClient('bench', bucket=bucket, transport=close.async_transport(),
+                                                   sleep=clock.async_sleep),
+    )
+
+    with tempfile.TemporaryDirectory() as tmp_dir, patched_config(
+            JOURNAL_DIR=f"{tmp_dir}/journal",
+            SEARCH_CACHE_DB=f"{tmp_dir}/search_cache.sqlite",
+            SHEET_CACHE_DB=f"{tmp_dir}/sheet_cache.sqlite",
+            HISTORY_DB=f"{tmp_dir}/run_history.sqlite",
+            METRICS_SUMMARY_FILE=None,
+            BULK_POLL_INTERVAL=0.01,
+            BULK_POLL_MAX_INTERVAL=0.05,
+            BULK_POLL_BATCH=100,
+            ASYNC_STARTUP=async_startup,
+            DRY_RUN=False):
+        previous = set_services(container)
+        registry.reset()
+        output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        try:
+            with output:
+                processor = EnrollProcessor(functions)
+                processor.schedule = CronSpec('* * * * *', Config.TIMEZONE)
+                processor.sleep = clock.sleep
+                processor.clock = clock.now
+                started = time.perf_counter()
+                success, message = processor.process_enrollment()
+                wall_seconds = time.perf_counter() - started
+                processor.search_cache.close()
+                processor.sheet_cache.close()
+                processor.history.close()
+        finally:
+            set_services(previous)
+
+    outcomes = {item['labels']['outcome']: item['value'] for item in SUBSCRIPTIONS.snapshot()}
+    processed = sum(outcomes.values())
+    api_calls = {f"{method.upper()} {endpoint}": count for (method, endpoint), count in sorted(close.calls.items())}
+    total_api_calls = sum(close.calls.values())
+    return {
+        'workload': asdict(workload),
+        'async_startup': async_startup,
+        'success': success,
+        'message': message,
+        'wall_seconds': round(wall_seconds, 3),
+        'rows_per_second': round(processed / wall_seconds, 1) if wall_seconds else None,
+        'phases': {item['labels']['phase']: round(item['sum'], 3) for item in PHASE_SECONDS.snapshot()},
+        'outcomes': outcomes,
+        'api_calls': api_calls,
+        'api_calls_total': total_api_calls,
+        'api_calls_per_row': round(total_api_calls / processed, 3) if processed else None,
+        'api_statuses': {str(status): count for status, count in sorted(close.statuses.items())},
+        'sheets_calls': dict(sorted(spreadsheets.calls.items())),
+        'sheets_calls_total': sum(spreadsheets.calls.values()),
+        'rate_limit_pauses': bucket.pauses,
+        'virtual_pacing_seconds': round(PACING_SECONDS.value(), 1),
+        'virtual_sleep_seconds': round(clock.slept, 1),
+    }
+
+
+def compare_with_baseline(result, baseline, tolerance):
+    """
+    Сравнивает число обращений к API и пауз по квоте с базовым прогоном
+    :return: список описаний регрессий (пустой, если регрессий нет)
+    """
+    regressions = []
+    checks = [('api_calls_total', result['api_calls_total'], baseline.get('api_calls_total')),
+              ('rate_limit_pauses', result['rate_limit_pauses'], baseline.get('rate_limit_pauses'))]
+    # Число выгрузок отчета зависит от того, как потоки заполняют буфер, поэтому сравниваются только чтения
+    checks += [(f"sheets_calls[{name}]", result['sheets_calls'].get(name, 0), count)
+               for name, count in baseline.get('sheets_calls', {}).items() if name in SHEETS_READ_OPS]
+    checks += [(f"api_calls[{name}]", result['api_calls'].get(name, 0), count)
+               for name, count in baseline.get('api_calls', {}).items()]
+    checks += [(f"api_calls[{name}]", count, 0)
+               for name, count in result['api_calls'].items() if name not in baseline.get('api_calls', {})]
+    for name, current, expected in checks:
+        if expected is None:
+            continue
+        if current > expected * (1 + tolerance):
+            regressions.append(f"{name}: {current} > {expected} (+{tolerance:.0%})")
+    return regressions
+
+
+def format_result(result):
+    """Текстовый отчет о прогоне"""
+    workload = result['workload']
+    lines = [
+        f"Нагрузка {workload['name']}: {workload['sheets']} листов, {workload['rows']} строк, "
+        f"{workload['sequences']} цепочек, {workload['mailboxes']} ящиков",
+        f"Результат: {result['message']}",
+        f"Время: {result['wall_seconds']} с, {result['rows_per_second']} строк/с",
+        "Фазы, с:",
+    ]
+    lines += [f"  {phase}: {seconds}" for phase, seconds in result['phases'].items()]
+    lines.append(f"Запросы к Close: {result['api_calls_total']} ({result['api_calls_per_row']} на строку)")
+    lines += [f"  {name}: {count}" for name, count in result['api_calls'].items()]
+    lines.append(f"Статусы Close: {result['api_statuses']}, пауз по квоте: {result['rate_limit_pauses']}")
+    lines.append(f"Запросы к Sheets: {result['sheets_calls_total']} {result['sheets_calls']}")
+    lines.append(f"Виртуальное ожидание: {result['virtual_sleep_seconds']} с "
+                 f"(паузы между подписками {result['virtual_pacing_seconds']} с)")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк энроллинга")
+    parser.add_argument('--workload', choices=sorted(WORKLOADS), default='ci')
+    parser.add_argument('--rows', type=int, help="переопределить число строк")
+    parser.add_argument('--sheets', type=int, help="переопределить число листов")
+    parser.add_argument('--sequences', type=int, help="переопределить число цепочек")
+    parser.add_argument('--close-latency', type=float, help="задержка Close, с")
+    parser.add_argument('--error-rate', type=float, help="доля ответов 500")
+    parser.add_argument('--rate-limit-rate', type=float, help="доля ответов 429")
+    parser.add_argument('--sync-startup', action='store_true', help="загружать каталоги без асинхронного клиента")
+    parser.add_argument('--output', help="сохранить результат в JSON")
+    parser.add_argument('--baseline', help="JSON базового прогона для проверки регрессий")
+    parser.add_argument('--save-baseline', help="сохранить результат как базовый прогон")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="допустимый рост числа запросов")
+    parser.add_argument('--verbose', action='store_true', help="показывать вывод энроллинга")
+    args = parser.parse_args(argv)
+
+    overrides = {name: getattr(args, name) for name in
+                 ('rows', 'sheets', 'sequences', 'close_latency', 'error_rate', 'rate_limit_rate')
+                 if getattr(args, name) is not None}
+    workload = replace(WORKLOADS[args.workload], **overrides)
+
+    result = run_benchmark(workload, async_startup=not args.sync_startup, verbose=args.verbose)
+    print(format_result(result))
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(result, baseline, args.tolerance)
+        if regressions:
+            print("Регрессия числа запросов:\n  " + '\n  '.join(regressions))
+            return 1
+        print("Число запросов в пределах базового прогона")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
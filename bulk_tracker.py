@@ -0,0 +1,160 @@
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import color_prints as p
+from config import Config
+from metrics import BULK_ACTIONS, BULK_COMPLETION_SECONDS, BULK_LEADS
+
+# Статусы bulk action Close, после которых задача больше не меняется
+FINISHED_STATUSES = ('completed', 'error', 'canceled')
+UNFINISHED = 'не завершено'
+
+
+@dataclass(frozen=True, slots=True)
+class BulkResult:
+    """Итог bulk action подписки на цепочку"""
+    bulk_id: str
+    row: object  # EnrollRow, по которой создана подписка
+    status: str
+    n_objects: int = None  # лидов в задаче
+    n_processed: int = None  # лидов обработано (подписано)
+    seconds: float = None  # от создания задачи до завершения
+
+    @property
+    def n_failed(self):
+        if self.n_objects is None or self.n_processed is None:
+            return None
+        return max(0, self.n_objects - self.n_processed)
+
+
+class BulkActionTracker:
+    """
+    Фоновое отслеживание bulk action подписок на цепочки.
+    Подписка в Close выполняется асинхронно: ответ subscribe означает только, что задача принята.
+    Трекер собирает id задач и опрашивает их статус пачками в своем потоке;
+    если за раунд ничего не завершилось, интервал опроса удваивается до max_interval.
+    Обработка подписок трекер не ждет, ожидание итогов - только в finish()
+    """
+
+    def __init__(self, api_client, interval=None, max_interval=None, batch_size=None, clock=time.monotonic):
+        self.api_client = api_client
+        self.interval = interval or Config.BULK_POLL_INTERVAL
+        self.max_interval = max_interval or Config.BULK_POLL_MAX_INTERVAL
+        self.batch_size = batch_size or Config.BULK_POLL_BATCH
+        self.clock = clock
+        self.results = []
+        self.poll_errors = 0
+        self._pending = OrderedDict()  # bulk_id -> (строка, время создания)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._finishing = threading.Event()
+        self._done = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="bulk-tracker")
+        self._thread.start()
+        return self
+
+    def track(self, bulk_id, row):
+        """Добавляет созданную задачу в отслеживание (вызывается из потоков обработки, не блокирует)"""
+        if not bulk_id:
+            return
+        with self._lock:
+            self._pending[bulk_id] = (row, self.clock())
+
+    @property
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            progressed = self.poll_once()
+            delay = self.interval if progressed else min(self.max_interval, delay * 2)
+            if self._finishing.is_set() and not self.pending_count:
+                self._done.set()
+                break
+
+    def poll_once(self):
+        """
+        Опрашивает до batch_size самых давно не проверенных задач
+        :return: True, если хотя бы одна задача завершилась
+        """
+        with self._lock:
+            batch = list(self._pending.items())[:self.batch_size]
+            # Опрошенные задачи уходят в конец очереди, чтобы следующая пачка проверила другие
+            for bulk_id, _ in batch:
+                self._pending.move_to_end(bulk_id)
+
+        progressed = False
+        for bulk_id, (row, created) in batch:
+            if self._stop.is_set():
+                break
+            try:
+                resp = self.api_client.get_bulk_action(bulk_id)
+            except Exception as e:
+                self.poll_errors += 1
+                p.print_warning(f"Не удалось получить статус {bulk_id}: {str(e)}")
+                continue
+            status = resp.get('status')
+            if status not in FINISHED_STATUSES:
+                continue
+            self._finish(BulkResult(
+                bulk_id=bulk_id,
+                row=row,
+                status=status,
+                n_objects=resp.get('n_objects'),
+                n_processed=resp.get('n_objects_processed'),
+                seconds=self.clock() - created,
+            ))
+            progressed = True
+        return progressed
+
+    def _finish(self, result):
+        with self._lock:
+            if self._pending.pop(result.bulk_id, None) is None:
+                return
+            self.results.append(result)
+        BULK_ACTIONS.inc(status=result.status)
+        if result.n_processed is not None:
+            BULK_LEADS.inc(result.n_processed, outcome='enrolled')
+        if result.n_failed:
+            BULK_LEADS.inc(result.n_failed, outcome='failed')
+        if result.seconds is not None:
+            BULK_COMPLETION_SECONDS.observe(result.seconds)
+
+    def finish(self, timeout=None):
+        """
+        Ждет завершения всех задач не дольше timeout секунд и останавливает опрос.
+        Незавершенные к этому моменту задачи попадают в итоги со статусом "не завершено"
+        :return: список BulkResult
+        """
+        timeout = Config.BULK_TRACK_TIMEOUT if timeout is None else timeout
+        self._finishing.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._done.wait(timeout)
+        self.stop()
+
+        with self._lock:
+            unfinished, self._pending = self._pending, OrderedDict()
+        for bulk_id, (row, _) in unfinished.items():
+            self.results.append(BulkResult(bulk_id=bulk_id, row=row, status=UNFINISHED))
+            BULK_ACTIONS.inc(status='unfinished')
+        return self.results
+
+    def stop(self):
+        """Останавливает опрос без ожидания"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
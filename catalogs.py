@@ -0,0 +1,203 @@
+import time
+import threading
+from config import Config
+from paginator import paginate
+
+
+def normalize_email(email):
+    """Приводит email к виду, используемому как ключ индекса"""
+    return (email or '').strip().lower()
+
+
+class ConnectedAccountIndex:
+    """
+    Индекс подключенных почтовых ящиков Close.
+    Загружает все ящики один раз (с учетом пагинации) и отвечает на поиск по email за O(1).
+    Кэш устаревает через ttl секунд; промах при поиске вызывает не более одной
+    внеочередной перезагрузки за период жизни кэша.
+    """
+
+    def __init__(self, api, ttl=None):
+        self.api = api
+        self.ttl = Config.ACCOUNTS_CACHE_TTL if ttl is None else ttl
+        self._by_email = {}
+        self._loaded_at = None
+        self._miss_refreshed = False
+        self._lock = threading.RLock()
+
+    def _is_expired(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def refresh(self):
+        """Перезагружает все ящики и перестраивает индекс"""
+        with self._lock:
+            return self._refresh()
+
+    def load(self, accounts):
+        """Строит индекс из уже полученного списка ящиков"""
+        with self._lock:
+            return self._refresh(accounts)
+
+    def _refresh(self, accounts=None):
+        if accounts is None:
+            accounts = paginate(self.api, 'connected_account')
+        by_email = {}
+        for acct in accounts:
+            key = normalize_email(acct.get('email'))
+            if not key:
+                continue
+            by_email.setdefault(key, {}).setdefault(acct.get('send_status'), acct)
+        self._by_email = by_email
+        self._loaded_at = time.monotonic()
+        self._miss_refreshed = False
+        return len(by_email)
+
+    def get(self, email, send_status='ok'):
+        """Возвращает ящик по email и статусу отправки или None"""
+        key = normalize_email(email)
+        with self._lock:
+            if self._is_expired():
+                self._refresh()
+
+            acct = self._by_email.get(key, {}).get(send_status)
+            if acct is None and not self._miss_refreshed:
+                # Ящик мог быть подключен после загрузки индекса - одна внеочередная попытка
+                self._refresh()
+                self._miss_refreshed = True
+                acct = self._by_email.get(key, {}).get(send_status)
+            return acct
+
+    def __len__(self):
+        return len(self._by_email)
+
+
+def normalize_name(name):
+    """Приводит название цепочки к виду, используемому как ключ каталога"""
+    return (name or '').strip().casefold()
+
+
+class SequenceCatalog:
+    """
+    Каталог цепочек Close по названию.
+    Один обход эндпоинта sequence строит словарь нормализованное название -> цепочка,
+    поэтому разрешение любого количества названий стоит одного обхода.
+    Загрузки выполняются под блокировкой: разрешение названий дождется загрузки,
+    начатой в другом потоке, и не запустит вторую.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self._by_name = {}
+        self.duplicates = {}
+        self._loaded = False
+        self._lock = threading.RLock()
+
+    def _add(self, seq):
+        key = normalize_name(seq.get('name'))
+        if key in self._by_name:
+            if self._by_name[key]['id'] != seq['id']:
+                self.duplicates.setdefault(key, [self._by_name[key]['id']])
+                if seq['id'] not in self.duplicates[key]:
+                    self.duplicates[key].append(seq['id'])
+            return
+        self._by_name[key] = seq
+
+    def load(self, sequences):
+        """Строит каталог из уже полученного списка цепочек"""
+        with self._lock:
+            self._by_name = {}
+            self.duplicates = {}
+            for seq in sequences:
+                self._add(seq)
+            self._loaded = True
+            return len(self._by_name)
+
+    def refresh(self, wanted=None):
+        """
+        Обходит цепочки и пополняет каталог.
+        Если передан набор wanted, обход прекращается, как только все названия найдены
+        :param wanted: нормализованные названия, ради которых выполняется дозагрузка
+        :return: None
+        """
+        with self._lock:
+            self._refresh(wanted)
+
+    def _refresh(self, wanted=None):
+        if wanted is None:
+            self._by_name = {}
+            self.duplicates = {}
+        pending = set(wanted) if wanted is not None else None
+        for seq in paginate(self.api, 'sequence'):
+            self._add(seq)
+            if pending is not None:
+                pending.discard(normalize_name(seq.get('name')))
+                if not pending:
+                    return
+        if wanted is None:
+            self._loaded = True
+
+    def get(self, name):
+        """Возвращает цепочку по названию без обращения к API или None"""
+        with self._lock:
+            return self._by_name.get(normalize_name(name))
+
+    def resolve(self, names):
+        """
+        Разрешает названия цепочек в объекты цепочек
+        :param names: итерируемое с названиями
+        :return: словарь исходное название -> цепочка или None
+        """
+        names = list(names)
+        with self._lock:
+            just_loaded = not self._loaded
+            if just_loaded:
+                self._refresh()
+
+            missing = {normalize_name(n) for n in names if normalize_name(n) not in self._by_name}
+            if missing and not just_loaded:
+                # Цепочки могли появиться после загрузки каталога - одна дозагрузка на все пропуски
+                self._refresh(wanted=missing)
+
+            return {name: self.get(name) for name in names}
+
+    def __len__(self):
+        return len(self._by_name)
+
+
+class UserDirectory:
+    """Справочник пользователей Close по id, загружается целиком один раз при первом обращении"""
+
+    def __init__(self, api):
+        self.api = api
+        self._by_id = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Перезагружает всех пользователей"""
+        with self._lock:
+            self._by_id = {user['id']: user for user in paginate(self.api, 'user')}
+            return len(self._by_id)
+
+    def load(self, users):
+        """Строит справочник из уже полученного списка пользователей"""
+        with self._lock:
+            self._by_id = {user['id']: user for user in users}
+            return len(self._by_id)
+
+    def get(self, user_id):
+        """Возвращает пользователя по id или None"""
+        if self._by_id is None:
+            with self._lock:
+                if self._by_id is None:
+                    self._by_id = {user['id']: user for user in paginate(self.api, 'user')}
+        return self._by_id.get(user_id)
+
+    def full_name(self, user_id):
+        """Имя и фамилия пользователя или пустая строка"""
+        user = self.get(user_id)
+        if not user:
+            return ''
+        return f"{user.get('first_name') or ''} {user.get('last_name') or ''}".strip()
+
+    def __len__(self):
+        return len(self._by_id or {})
@@ -0,0 +1,207 @@
+import time
+import threading
+from collections import Counter, deque
+from config import Config
+from metrics import BREAKER_TRANSITIONS
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+STOPPED = 'stopped'
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи со скользящим окном последних исходов.
+    Цепь размыкается, когда доля ошибок одного класса в окне достигает error_rate
+    (если error_classes не задан - доля любых ошибок). Через cooldown секунд пропускается
+    одна пробная операция (полуоткрытое состояние): успех замыкает цепь, ошибка размыкает
+    ее снова с удвоенной паузой, после max_probes неудачных проб цепь останавливается до конца запуска.
+    """
+
+    def __init__(self, name, window, min_calls, error_rate, error_classes=None,
+                 cooldown=None, max_probes=None, clock=time.monotonic):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.error_classes = error_classes
+        self.cooldown = Config.BREAKER_COOLDOWN if cooldown is None else cooldown
+        self.max_probes = Config.BREAKER_MAX_PROBES if max_probes is None else max_probes
+        self.clock = clock
+        self.state = CLOSED
+        self.reason = None
+        self.failed_probes = 0
+        self._outcomes = deque(maxlen=window)  # класс ошибки или None при успехе
+        self._open_until = None
+        self._probe = None  # поток, выполняющий пробную операцию
+        self._cond = threading.Condition()
+
+    def _relevant(self, error_class):
+        return error_class is not None and (self.error_classes is None or error_class in self.error_classes)
+
+    def _tripped(self):
+        """Класс ошибок, доля которого в окне достигла порога, и эта доля"""
+        if len(self._outcomes) < self.min_calls:
+            return None, 0.0
+        if self.error_classes is None:
+            errors = Counter(outcome for outcome in self._outcomes if outcome is not None)
+            rate = sum(errors.values()) / len(self._outcomes)
+            return (errors.most_common(1)[0][0], rate) if rate >= self.error_rate else (None, rate)
+        errors = Counter(outcome for outcome in self._outcomes if self._relevant(outcome))
+        for error_class, count in errors.most_common():
+            rate = count / len(self._outcomes)
+            if rate >= self.error_rate:
+                return error_class, rate
+        return None, 0.0
+
+    def _open(self, reason):
+        self.state = OPEN
+        self.reason = reason
+        self._open_until = self.clock() + self.cooldown * 2 ** self.failed_probes
+        return OPEN
+
+    def acquire(self, sleep=time.sleep):
+        """
+        Ждет, пока цепь пропускает операции: при разомкнутой цепи - до пробной операции,
+        при выполняющейся пробе - до ее исхода
+        :param sleep: функция ожидания паузы до пробы
+        :return: True - операцию можно выполнять, False - цепь остановлена
+        """
+        while True:
+            with self._cond:
+                if self.state == CLOSED:
+                    return True
+                if self.state == STOPPED:
+                    return False
+                if self.state == HALF_OPEN:
+                    self._cond.wait(1.0)
+                    continue
+                wait = self._open_until - self.clock()
+                if wait <= 0:
+                    self.state = HALF_OPEN
+                    self._probe = threading.get_ident()
+                    return True
+            sleep(wait)
+
+    def release(self):
+        """Возвращает пробу, если поток получил ее, но операцию не выполнил"""
+        with self._cond:
+            if self.state == HALF_OPEN and self._probe == threading.get_ident():
+                self._probe = None
+                self.state = OPEN
+                self._open_until = self.clock()
+                self._cond.notify_all()
+
+    def record(self, error_class):
+        """
+        Учитывает исход операции
+        :param error_class: класс ошибки (errors.classify_error) или None при успехе
+        :return: новое состояние цепи, если оно изменилось, иначе None
+        """
+        with self._cond:
+            if self.state == HALF_OPEN and self._probe == threading.get_ident():
+                self._probe = None
+                self._cond.notify_all()
+                if not self._relevant(error_class):
+                    self.state = CLOSED
+                    self.reason = None
+                    self.failed_probes = 0
+                    self._outcomes.clear()
+                    return CLOSED
+                self.failed_probes += 1
+                if self.failed_probes >= self.max_probes:
+                    self.state = STOPPED
+                    self.reason = f"{error_class}, неудачных проб: {self.failed_probes}"
+                    return STOPPED
+                return self._open(f"{error_class}, неудачных проб: {self.failed_probes}")
+
+            # Исходы операций, начатых до размыкания, на состояние не влияют
+            if self.state != CLOSED:
+                return None
+            self._outcomes.append(error_class)
+            error_class, rate = self._tripped()
+            if error_class is None:
+                return None
+            return self._open(f"{error_class}: {rate:.0%} ошибок из {len(self._outcomes)} последних")
+
+
+class RunBreakers:
+    """
+    Размыкатели цепи одного запуска: общий по классам ошибок ключа и сервиса Close
+    (Config.BREAKER_GLOBAL_ERRORS) и отдельный для каждого почтового ящика.
+    Разомкнутый общий размыкатель приостанавливает все ящики, ящиковый - только свой ящик.
+    Остановленный размыкатель пропускает оставшиеся строки без запросов и пауз.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep, on_change=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.on_change = on_change
+        self.global_breaker = CircuitBreaker(
+            'global',
+            window=Config.BREAKER_WINDOW,
+            min_calls=Config.BREAKER_MIN_CALLS,
+            error_rate=Config.BREAKER_ERROR_RATE,
+            error_classes=Config.BREAKER_GLOBAL_ERRORS,
+            clock=clock,
+        )
+        self.mailboxes = {}
+        self._lock = threading.Lock()
+
+    def mailbox(self, key):
+        with self._lock:
+            breaker = self.mailboxes.get(key)
+            if breaker is None:
+                breaker = self.mailboxes[key] = CircuitBreaker(
+                    key,
+                    window=Config.BREAKER_MAILBOX_WINDOW,
+                    min_calls=Config.BREAKER_MAILBOX_MIN_CALLS,
+                    error_rate=Config.BREAKER_MAILBOX_ERROR_RATE,
+                    clock=self.clock,
+                )
+            return breaker
+
+    def admit(self, key):
+        """
+        Ждет разрешения на подписку ящика (во время паузы разомкнутой цепи)
+        :param key: нормализованный email ящика
+        :return: None - подписку можно выполнять, иначе причина пропуска строки
+        """
+        mailbox = self.mailbox(key)
+        # Сначала ящик: ожидание паузы ящика не должно удерживать общую пробу
+        if not mailbox.acquire(self.sleep):
+            return f"ящик остановлен ({mailbox.reason})"
+        if not self.global_breaker.acquire(self.sleep):
+            mailbox.release()
+            return f"обработка остановлена ({self.global_breaker.reason})"
+        return None
+
+    def record(self, key, error_class):
+        """
+        Учитывает исход подписки ящика
+        :param error_class: класс ошибки или None при успехе
+        """
+        for scope, breaker in (('mailbox', self.mailbox(key)), ('global', self.global_breaker)):
+            state = breaker.record(error_class)
+            if state is None:
+                continue
+            BREAKER_TRANSITIONS.inc(scope=scope, state=state)
+            if self.on_change is not None:
+                self.on_change(scope, breaker)
+
+    @property
+    def stopped(self):
+        """Обработка остановлена общим размыкателем"""
+        return self.global_breaker.state == STOPPED
+
+    def summary(self):
+        """Текстовая сводка разомкнутых и остановленных цепей"""
+        lines = []
+        if self.global_breaker.state != CLOSED:
+            lines.append(f"Общая цепь: {self.global_breaker.state} ({self.global_breaker.reason})")
+        with self._lock:
+            mailboxes = list(self.mailboxes.values())
+        for breaker in mailboxes:
+            if breaker.state != CLOSED:
+                lines.append(f"  {breaker.name}: {breaker.state} ({breaker.reason})")
+        return '\n'.join(lines)
@@ -1,29 +1,122 @@
-from datetime import time
-
-
 class Config:
     # Основные настройки
     SPREAD_NAME = "Rubrain - Enroll CN"
+    REPORT_SPREAD_NAME = None  # таблица для листов отчета, ошибок и итогов; None - таблица энроллинга
     SHEET_PREFIX = "111_"
+    CLOSE_API_KEY_ENV = "CLOSE_API_KEY_MARY"  # переменная окружения с ключом Close API
+    DATA_DIR = "data"  # история, журнал, кэши и состояние планировщика; в контейнере - смонтированный том
+
+    # Арендаторы: несколько команд в одном процессе, у каждой своя таблица, ключ и расписание.
+    # Пустой список - одна команда с настройками выше (имя default зарезервировано за ней).
+    # Необязательные параметры арендатора: report_spread_name, schedule_cron, timezone, holidays,
+    # rate_limit_rps, rate_limit_burst, max_mailbox_workers, journal_dir, search_cache_db,
+    # sheet_cache_db, history_db, state_file
+    TENANTS = []
+    # TENANTS = [
+    #     {"name": "cn", "spread_name": "Rubrain - Enroll CN", "sheet_prefix": "111_",
+    #      "api_key_env": "CLOSE_API_KEY_MARY"},
+    #     {"name": "eu", "spread_name": "Rubrain - Enroll EU", "sheet_prefix": "222_",
+    #      "api_key_env": "CLOSE_API_KEY_EU", "schedule_cron": "0 11 * * 1-5"},
+    # ]
 
     # Расписание
-    SCHEDULE_TIME = time(13, 35)  # 13:35
-    WORKING_DAYS = [0, 1, 2, 3, 4]  # Пн-Пт (0-пн, 6-вс)
+    SCHEDULE_CRON = "35 13 * * 1-5"  # cron: 13:35 Пн-Пт
+    TIMEZONE = "Europe/Moscow"
+    HOLIDAYS = []  # даты без запуска, "YYYY-MM-DD"
+    CATCH_UP_MISSED = True  # запустить сегодняшний пропущенный запуск после простоя
+    SCHEDULER_STATE_FILE = f"{DATA_DIR}/scheduler_state.json"
 
     # Настройки API
     API_TIMEOUT = 30  # секунд
-    MAX_RETRIES = 3
-    RETRY_DELAY = 60  # секунд
+    MAX_RETRIES = 5  # попыток на один запрос
+    BACKOFF_BASE = 1  # секунд, база экспоненциальной задержки
+    BACKOFF_MAX = 60  # секунд, потолок задержки между попытками
+    RATE_LIMIT_RPS = 10  # запросов в секунду ко всему Close API
+    RATE_LIMIT_BURST = 20  # максимальный всплеск запросов
+    ASYNC_STARTUP = True  # загружать каталоги Close параллельно асинхронным клиентом
+    ASYNC_MAX_CONNECTIONS = 10  # размер пула соединений асинхронного клиента
+    PREFETCH_TIMEOUTS = {  # секунд на загрузку каждого источника перед обработкой
+        'sheets': 180,
+        'sequence': 120,
+        'connected_account': 120,
+        'user': 60,
+    }
+    PAGE_LIMIT = 100  # размер страницы для списков Close API (_limit)
+    PAGINATION_WORKERS = 4  # потоков для параллельной загрузки страниц
+
+    # Кэши справочников Close
+    ACCOUNTS_CACHE_TTL = 3600  # секунд
+
+    # Кэш результатов поиска лидов (data/search/)
+    SEARCH_CACHE_TTL = 86400  # секунд, в любом случае не дольше текущих суток
+    SEARCH_CACHE_SIZE = 1024  # записей в памяти
+    SEARCH_CACHE_DB = f"{DATA_DIR}/search_cache.sqlite"  # None - только в памяти
+
+    # Кэш листов энроллинга: листы перечитываются, только если изменился modifiedTime таблицы в Drive.
+    # Работает, только если отчеты пишутся в отдельную таблицу (REPORT_SPREAD_NAME)
+    SHEET_CACHE_DB = f"{DATA_DIR}/sheet_cache.sqlite"  # None - только в памяти
 
     # Настройки подписок
     SUBSCRIPTION_DELAY_MIN = 115  # секунд
-    SUBSCRIPTION_DELAY_MAX = 125  # секунд
+    SUBSCRIPTION_DELAY_MAX = 125  # секунд (пауза между подписками одного ящика)
+    MAX_MAILBOX_WORKERS = 20  # ящиков, обрабатываемых параллельно
+    DRY_RUN = False  # только проверить строки и вывести план, без поиска и подписок
+
+    # Отслеживание bulk action подписок (сколько лидов реально подписано)
+    BULK_TRACKING = True
+    BULK_POLL_INTERVAL = 15  # секунд между опросами статусов
+    BULK_POLL_MAX_INTERVAL = 120  # секунд, потолок интервала, если задачи долго не завершаются
+    BULK_POLL_BATCH = 20  # задач за один опрос
+    BULK_TRACK_TIMEOUT = 900  # секунд ожидания итогов после последней подписки
+    BULK_REPORT_SHEET = "enrolling_bulkStatus"  # лист итогов (создается при первой выгрузке), None - только лог и метрики
+
+    # Журнал запусков (возобновление после перезапуска)
+    JOURNAL_DIR = f"{DATA_DIR}/journal"
+    JOURNAL_RETENTION_DAYS = 14
+
+    # Метрики
+    METRICS_PORT = 19100  # порт эндпоинта /metrics, None - не запускать
+    METRICS_SUMMARY_FILE = f"{DATA_DIR}/run_summary.json"  # JSON-сводка последнего запуска, None - не сохранять
+
+    # Выгрузка отчета во время обработки
+    REPORT_FLUSH_ROWS = 20  # строк в одной выгрузке
+    REPORT_FLUSH_INTERVAL = 300  # секунд между выгрузками по таймеру
+    REPORT_BUFFER_MAX = 1000  # строк в буфере при недоступности таблицы
+    REPORT_FLUSH_RETRIES = 3
+
+    # История запусков (SQLite): все строки отчета и ошибки ящиков, см. python history.py --help
+    HISTORY_DB = f"{DATA_DIR}/run_history.sqlite"
+    REPORT_SHEET = "enrolling_pyReport"  # лист отчета - окно последних дней истории
+    REPORT_VIEW_DAYS = 30  # дней истории на листе отчета, None - только дописывать строки
 
     # Логика ошибок
     ERROR_THRESHOLD = 0.9  # 90% ошибок - критический уровень
+
+    # Размыкатель цепи: приостановка обработки при серии ошибок, не дожидаясь конца запуска
+    BREAKER_ENABLED = True
+    BREAKER_WINDOW = 20  # последних подписок всех ящиков в окне общего размыкателя
+    BREAKER_MIN_CALLS = 5  # подписок в окне до первой проверки
+    BREAKER_ERROR_RATE = 0.8  # доля ошибок одного класса в окне, при которой цепь размыкается
+    # Ошибки ключа и сервиса Close. Ошибки данных строки (invalid request) и нераспознанные (unknown)
+    # учитываются только размыкателем ящика
+    BREAKER_GLOBAL_ERRORS = ('unauthorized', 'forbidden', 'rate limited', 'server error')
+    BREAKER_MAILBOX_WINDOW = 5  # последних подписок ящика в окне
+    BREAKER_MAILBOX_MIN_CALLS = 3
+    BREAKER_MAILBOX_ERROR_RATE = 1.0  # все подписки ящика в окне с ошибкой
+    BREAKER_COOLDOWN = 120  # секунд до пробной подписки, удваивается после каждой неудачной пробы
+    BREAKER_MAX_PROBES = 2  # неудачных проб, после которых строки ящика (или всего запуска) пропускаются
     RESTART_ON_CRITICAL_ERROR = True  # Перезапуск при критической ошибке
+    MAX_RESTARTS = 3  # перезапусков подряд после критической ошибки
+    RESTART_DELAY = 300  # секунд до перезапуска
 
     # Логирование
     LOG_TO_FILE = True
     LOG_FILE = "enroll_processor.log"
     LOG_LEVEL = "INFO"
+
+    # Уведомления в Telegram (дайджесты из фонового потока)
+    NOTIFY_DIGEST_INTERVAL = 60  # секунд между дайджестами
+    NOTIFY_URGENT_DELAY = 5  # секунд до отправки дайджеста с ошибкой
+    NOTIFY_QUEUE_MAX = 500  # разных сообщений в буфере, при переполнении вытесняются младшие уровни
+    NOTIFY_MESSAGE_LIMIT = 4000  # символов в одном сообщении Telegram (лимит 4096)
+    NOTIFY_SEND_RETRIES = 3  # попыток отправки дайджеста
@@ -1,89 +1,212 @@
-import json
-import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack
+import threading
 import random
-import pandas as pd
+import time
 from datetime import datetime as dt
 import color_prints as p
 from config import Config
 from api_client import APIClient
+from schedule_spec import CronSpec
+from tenants import DEFAULT_TENANT, default_tenant, tenant_path
+from pipeline import run_paced_by_key
+from planner import FilterCache, build_plan, dedupe_rows, row_filter_key
+from search_cache import SearchCache
+from sheet_cache import SheetCache, parse_sheet
+from report_writer import ReportWriter
+from bulk_tracker import BulkActionTracker, UNFINISHED
+from history import REPORT_HEADER, RunHistory, new_run_id
+from journal import RunJournal, cleanup_journals, journal_key
+from errors import classify_error
+from circuit_breaker import RunBreakers, STOPPED
+from prefetch import prefetch_sources, describe_error
+from metrics import PACING_SECONDS, SUBSCRIPTIONS, timed_phase, write_run_summary
+from catalogs import ConnectedAccountIndex, SequenceCatalog, UserDirectory, normalize_email, normalize_name
 from functions import write_spread_sheet
 from logger import setup_logger
 
 logger = setup_logger()
 
+BULK_REPORT_HEADER = ['Date', 'Bulk ID', 'Sheet', 'Sequence', 'Email', 'Status', 'Leads', 'Enrolled', 'Failed']
+
 
 class EnrollProcessor:
-    def __init__(self, functions_module):
+    def __init__(self, functions_module, tenant=None):
         self.f = functions_module
-        self.api_client = APIClient(functions_module.api)
+        self.tenant = tenant or default_tenant()
+        self.log_prefix = '' if self.tenant.name == DEFAULT_TENANT else f"[{self.tenant.name}] "
+        self.search_cache = SearchCache(db_path=self.tenant.search_cache_db or '')
+        self.sheet_cache = SheetCache(db_path=self.tenant.sheet_cache_db)
+        self.history = RunHistory(self.tenant.history_db)
+        self.run_id = None
+        self.api_client = APIClient(functions_module.api, search_cache=self.search_cache)
+        self.accounts = ConnectedAccountIndex(functions_module.api)
+        self.sequences = SequenceCatalog(functions_module.api)
+        self.filter_cache = FilterCache()
+        self.schedule = CronSpec(self.tenant.schedule_cron, self.tenant.timezone, self.tenant.holidays)
         self.last_run_date = None
-        self.users = self.f.api.get('user')['data']
+        self.journal = None
+        self.report_writer = None
+        self.bulk_tracker = None
+        self.users = UserDirectory(functions_module.api)
         self.acc_errors = []
+        self._errors_lock = threading.Lock()
+        self.sleep = time.sleep  # пауза между подписками, в бенчмарке подменяется виртуальной
+        self.clock = time.monotonic  # часы размыкателей цепи, в бенчмарке - виртуальные
+        self.breakers = None
 
     def should_run_today(self):
         """Проверяем, нужно ли запускать скрипт сегодня"""
-        today = dt.now().weekday()
-        if today not in Config.WORKING_DAYS:
+        today = self.schedule.now().date()
+        if not self.schedule.matches_day(today):
             p.print_warning(f"Сегодня выходной день, скрипт не запускается")
             return False
 
-        today_str = dt.now().strftime("%Y-%m-%d")
+        today_str = today.isoformat()
         if self.last_run_date == today_str:
             p.print_warning(f"Скрипт уже запускался сегодня {today_str}")
             return False
 
         return True
 
+    def load_enrolling_sheets(self):
+        """
+        Строки листов энроллинга.
+        Если отчеты пишутся в отдельную таблицу, сначала запрашивается modifiedTime таблицы в Drive:
+        если таблица не менялась с прошлой загрузки, листы берутся из кэша, иначе все листы читаются
+        одним batchGet и кэш обновляется
+        :return: словарь название листа -> список EnrollRow
+        """
+        spreadsheet = self.f.open_spreadsheet(self.tenant.spread_name)
+        modified_time = None
+        # Запись отчетов в ту же таблицу меняет ее modifiedTime при каждом запуске - кэш бы не срабатывал
+        if self.tenant.report_spread != self.tenant.spread_name:
+            try:
+                modified_time = spreadsheet.get_lastUpdateTime()
+            except Exception as e:
+                p.print_warning(f"Не удалось получить время изменения таблицы, кэш листов не используется: {str(e)}")
+
+        if modified_time:
+            sheets = self.sheet_cache.get(spreadsheet.id, modified_time)
+            if sheets is not None:
+                p.print_info(f"Таблица не менялась с {modified_time}, листы взяты из кэша")
+                return sheets
+
+        enrolling_sheets = [(worksheet.id, worksheet.title) for worksheet in spreadsheet.worksheets()
+                            if self.tenant.sheet_prefix in worksheet.title]
+
+        # Все листы читаются одним batchGet вместо отдельного запроса на каждый лист
+        sheet_ranges = self.f.get_sheets_ranges(
+            spread=self.tenant.spread_name,
+            sheet_names=[sheet_name for _, sheet_name in enrolling_sheets],
+            income_range="A:C"
+        )
+        sheets = [(sheet_id, sheet_name, sheet_ranges.get(sheet_name)) for sheet_id, sheet_name in enrolling_sheets]
+        if not modified_time:
+            return {sheet_name: parse_sheet(sheet_name, values) for _, sheet_name, values in sheets}
+        return self.sheet_cache.store(spreadsheet.id, modified_time, sheets)
+
+    def iter_enrolling_rows(self, email_lists=None):
+        """
+        Потоково отдает строки энроллинга по листам.
+        filters_json каждой строки разбирается один раз при загрузке
+        :param email_lists: если задан, отдаются только строки этих ящиков
+        :return: генератор EnrollRow
+        """
+        for sheet_name, rows in self.load_enrolling_sheets().items():
+            if not rows:
+                p.print_warning(f"Пустой лист: {sheet_name}")
+                continue
+
+            for row in rows:
+                if email_lists and row.email not in email_lists:
+                    continue
+                if row.filters_error:
+                    p.print_warning(f"{sheet_name}: {row.email} - {row.filters_error}")
+                yield row
+
     def load_enrolling_data(self):
         """Загружаем данные для энроллинга"""
         p.print_info("Загрузка данных для энроллинга...")
 
-        enrolling_sheets = self.f.get_sheet_titles(Config.SPREAD_NAME)
-        enrolling_reg = pd.DataFrame(columns=['email', 'url', 'filters_json', 'seq_name', 'sheet_name'])
-
-        for sheet_name in enrolling_sheets:
-            if Config.SHEET_PREFIX in sheet_name:
-                sheet_range = self.f.get_sheet_range(
-                    spread=Config.SPREAD_NAME,
-                    income_sheet=sheet_name,
-                    income_range="A:C"
-                )
-                if not sheet_range:
-                    p.print_warning(f"Пустой лист: {sheet_name}")
-                    continue
+        enrolling_reg = list(self.iter_enrolling_rows())
 
-                seq_name = sheet_range[0][0]
-                sheet_reg = pd.DataFrame(sheet_range[3:])
-                sheet_reg = sheet_reg.iloc[:, :3]
-                sheet_reg.columns = ['email', 'url', 'filters_json']
-                sheet_reg['seq_name'] = seq_name
-                sheet_reg['sheet_name'] = sheet_name
-                enrolling_reg = pd.concat([enrolling_reg, sheet_reg], ignore_index=True)
+        p.print_info(f"Загружено {len(enrolling_reg)} записей для обработки")
+        return enrolling_reg
+
+    def prefetch(self):
+        """
+        Одновременно загружает строки листов и каталоги цепочек, ящиков и пользователей.
+        Каталоги выкачиваются асинхронным клиентом (ASYNC_STARTUP), при его ошибке - обычными запросами;
+        чтение листов и обычные запросы идут в отдельных потоках. У каждого источника свой таймаут
+        (Config.PREFETCH_TIMEOUTS); каталог, который не удалось загрузить, подгружается по требованию
+        :return: WarmContext, строки энроллинга - в results['sheets']
+        """
+        catalogs = {'sequence': self.sequences, 'connected_account': self.accounts, 'user': self.users}
+        # Свой пул, а не пул цикла событий: asyncio.run не должен ждать зависшую загрузку после таймаута
+        executor = ThreadPoolExecutor(max_workers=len(catalogs) + 1, thread_name_prefix="prefetch")
+
+        async def load_catalog(client, endpoint, catalog):
+            loop = asyncio.get_running_loop()
+            if client is not None:
+                try:
+                    catalog.load(await client.collect(endpoint))
+                    return len(catalog)
+                except Exception as e:
+                    p.print_warning(f"Асинхронная загрузка {endpoint} не удалась: {str(e)}")
+            await loop.run_in_executor(executor, catalog.refresh)
+            return len(catalog)
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            sources = {'sheets': lambda: loop.run_in_executor(executor, self.load_enrolling_data)}
+            async with AsyncExitStack() as stack:
+                client = None
+                if Config.ASYNC_STARTUP:
+                    try:
+                        client = await stack.enter_async_context(self.f.get_async_api())
+                    except Exception as e:
+                        p.print_warning(f"Асинхронный клиент недоступен: {str(e)}")
+                for endpoint, catalog in catalogs.items():
+                    sources[endpoint] = lambda endpoint=endpoint, catalog=catalog: load_catalog(client, endpoint, catalog)
+                return await prefetch_sources(sources, Config.PREFETCH_TIMEOUTS, labels={'tenant': self.tenant.name})
 
-        email_lists = []
-        if email_lists:
-            enrolling_reg = enrolling_reg[enrolling_reg['email'].isin(email_lists)]
+        try:
+            context = asyncio.run(run())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        p.print_info(f"Загружено {len(enrolling_reg)} записей для обработки")
-        return enrolling_reg.to_dict(orient='records')
+        p.print_info(context.summary())
+        failed_catalogs = [source for source in context.failures if source != 'sheets']
+        if failed_catalogs:
+            details = '\n'.join(f"{source}: {describe_error(context.failures[source])}" for source in failed_catalogs)
+            logger.warning(self.log_prefix + f"⚠️ Каталоги не загружены заранее, будут подгружены по требованию:\n{details}")
+        return context
 
     def get_sequence_ids(self, enrolling_reg):
         """Получаем ID цепочек"""
-        seq_names = {row['seq_name'] for row in enrolling_reg}
+        seq_names = {row.seq_name for row in enrolling_reg}
 
         seqID_dict = {}
-        for seq_name in seq_names:
-            try:
-                seq = self.f.find_sequence_by_name(seq_name)
-                seq_id = seq['id'] if seq else None
-                seqID_dict[seq_name] = seq_id
-                if seq_id:
-                    p.print_success(f"Найдена цепочка: {seq_name} -> {seq_id}")
-                else:
-                    p.print_warning(f"Цепочка не найдена: {seq_name}")
-            except Exception as e:
-                p.print_error(f"Ошибка поиска цепочки {seq_name}: {str(e)}")
-                seqID_dict[seq_name] = None
+        try:
+            found = self.sequences.resolve(seq_names)
+        except Exception as e:
+            p.print_error(f"Ошибка загрузки каталога цепочек: {str(e)}")
+            return {seq_name: None for seq_name in seq_names}
+
+        for seq_name, seq in found.items():
+            seq_id = seq['id'] if seq else None
+            seqID_dict[seq_name] = seq_id
+            if seq_id:
+                p.print_success(f"Найдена цепочка: {seq_name} -> {seq_id}")
+            else:
+                p.print_warning(f"Цепочка не найдена: {seq_name}")
+
+            duplicate_ids = self.sequences.duplicates.get(normalize_name(seq_name))
+            if duplicate_ids:
+                p.print_warning(f"Несколько цепочек с названием {seq_name}: {', '.join(duplicate_ids)}, "
+                                f"используется {seq_id}")
 
         return seqID_dict
 
@@ -92,215 +215,488 @@ class EnrollProcessor:
         if not self.should_run_today():
             return True, "Skipped - not a working day or already run today"
 
+        started = time.perf_counter()
+        # Ошибки ящиков копятся за один запуск: процессор планировщика живет между запусками
+        self.acc_errors = []
         try:
-            enrolling_reg = self.load_enrolling_data()
+            # Листы и каталоги Close загружаются одновременно
+            with timed_phase(self.tenant.name, 'prefetch'):
+                warm = self.prefetch()
+            if 'sheets' in warm.failures:
+                raise RuntimeError(f"не удалось загрузить листы: {describe_error(warm.failures['sheets'])}")
+            enrolling_reg = warm.results['sheets']
             if not enrolling_reg:
                 p.print_warning("Нет данных для обработки")
-                logger.warning("⚠️ Нет данных для обработки энроллинга")
+                logger.warning(self.log_prefix + "⚠️ Нет данных для обработки энроллинга")
                 return True, "No data to process"
 
             # Уведомление о начале работы
-            total_subscriptions = len([r for r in enrolling_reg if r['filters_json']])
+            total_subscriptions = len([r for r in enrolling_reg if r.filters_json])
             start_message = f"🚀 Начало процесса энроллинга\nЗапланировано подписок: {total_subscriptions}"
             p.print_info(start_message)
-            logger.info(start_message)
+            logger.info(self.log_prefix + start_message)
+
+            with timed_phase(self.tenant.name, 'resolve_sequences'):
+                seqID_dict = self.get_sequence_ids(enrolling_reg)
+            p.print_info(f"Загружено почтовых ящиков: {len(self.accounts)}")
+
+            # Все строки проверяются до первого запроса на поиск/подписку;
+            # повторы (ящик, цепочка, фильтр) с разных листов выполняются один раз
+            with timed_phase(self.tenant.name, 'plan'):
+                dedup = self.dedupe(enrolling_reg)
+                plan = build_plan(dedup.rows, seqID_dict, self.accounts, self.filter_cache)
+            p.print_info(plan.summary())
+            if Config.DRY_RUN:
+                logger.info(self.log_prefix + f"🧪 Dry-run энроллинга\n{plan.summary()}\n{dedup.summary()}")
+                return True, f"Dry run: {len(plan.items)} planned, {len(plan.rejected)} rejected"
+
+            total_count = len(plan)
+            self.run_id = new_run_id()
+            self._import_report_sheet()
+
+            # Строки, успешно обработанные сегодня до перезапуска, пропускаются
+            cleanup_journals(self.tenant.journal_dir)
+            self.journal = RunJournal(self.tenant.journal_dir)
+            self.report_writer = ReportWriter(self._append_report_rows, journal=self.journal).start()
+            # Статусы созданных bulk action опрашиваются в фоне, пока идут подписки
+            if Config.BULK_TRACKING:
+                self.bulk_tracker = BulkActionTracker(self.api_client).start()
+            # Строки прошлых запусков, которые не удалось выгрузить, идут в отчет первыми
+            for entry_id, report_row in self.journal.pending_report_rows():
+                self.report_writer.add(entry_id, report_row)
+            items = [item for item in plan.items if not self.journal.is_completed(self._journal_key(item))]
+            resumed_count = len(plan.items) - len(items)
+            if resumed_count:
+                p.print_info(f"Возобновление: пропущено {resumed_count} уже выполненных подписок")
+
+            # Отклоненные строки известны заранее и попадают в отчет сразу,
+            # при перезапуске в тот же день - только если их еще нет в журнале
+            for rejected in plan.rejected:
+                result, is_error = self._rejected_result(rejected)
+                if self._record_once(rejected, rejected.index, result, is_error, 'rejected'):
+                    SUBSCRIPTIONS.inc(tenant=self.tenant.name, outcome='rejected')
+
+            # Удаленные дубли попадают в отчет со ссылкой на выполняемую строку.
+            # В журнале дубль не считается выполненным: без основной строки он будет обработан
+            for duplicate in dedup.duplicates:
+                result = self._duplicate_result(duplicate)
+                if self._record_once(duplicate, total_count, result, True, 'duplicate'):
+                    SUBSCRIPTIONS.inc(tenant=self.tenant.name, outcome='duplicate')
+
+            p.print_info(f"Начинаем обработку {len(items)} подписок...")
+            if Config.BREAKER_ENABLED:
+                self.breakers = RunBreakers(clock=self.clock, sleep=self.sleep, on_change=self._breaker_changed)
+
+            # Пауза выдерживается между подписками одного ящика, разные ящики идут параллельно,
+            # отклоненные строки не занимают слотов паузы
+            with timed_phase(self.tenant.name, 'subscriptions'):
+                results = run_paced_by_key(
+                    items,
+                    key=lambda item: normalize_email(item.account['email']),
+                    handler=self._process_item,
+                    delay=lambda: random.uniform(Config.SUBSCRIPTION_DELAY_MIN, Config.SUBSCRIPTION_DELAY_MAX),
+                    max_workers=self.tenant.max_mailbox_workers,
+                    sleep=self._pacing_sleep,
+                    # После пропущенной строки паузы нет: подписки не было
+                    paced=lambda outcome: outcome[1] != 'skipped',
+                )
 
-            seqID_dict = self.get_sequence_ids(enrolling_reg)
+            success_count = resumed_count
+            error_count = len(plan.rejected)
+            skipped_count = 0
+            for result, outcome in results:
+                if outcome == 'skipped':
+                    skipped_count += 1
+                elif outcome == 'error':
+                    error_count += 1
+                else:
+                    success_count += 1
 
-            report = [['date_time', 'url', 'sheet', 'seq_name', 'email', 'total_leads', 'bulk_response']]
-            success_count = 0
-            error_count = 0
-            total_count = len([r for r in enrolling_reg if r['filters_json']])
+            # Анализ результатов и сохранение отчета
+            with timed_phase(self.tenant.name, 'report'):
+                self._save_report()
+                self.write_error_log(self.acc_errors)
+            self.journal.close()
+            with timed_phase(self.tenant.name, 'bulk_tracking'):
+                bulk_counts = self._collect_bulk_results()
+            success, message = self._analyze_results(success_count, error_count, total_count, skipped_count,
+                                                     bulk_counts)
+            self._write_summary(started, success, message, total=total_count, succeeded=success_count,
+                                failed=error_count, skipped=skipped_count, rejected=len(plan.rejected),
+                                resumed=resumed_count,
+                                **bulk_counts)
+            return success, message
 
-            p.print_info(f"Начинаем обработку {total_count} подписок...")
+        except Exception as e:
+            error_msg = f"Критическая ошибка в основном процессе: {str(e)}"
+            p.print_error(error_msg)
+            logger.error(self.log_prefix + f"🔴 ENROLLING CRITICAL: {error_msg}")
+            if self.report_writer:
+                self.report_writer.close()
+            if self.journal:
+                self.journal.close()
+            if self.bulk_tracker:
+                self.bulk_tracker.stop()
+                self.bulk_tracker = None
+            self._write_summary(started, False, str(e))
+            return False, f"Process error: {str(e)}"
 
-            for i, row in enumerate(enrolling_reg):
-                if not row['filters_json']:
-                    continue
+    def _collect_bulk_results(self):
+        """Ждет итогов bulk action подписок, выгружает их на лист итогов и возвращает счетчики"""
+        if self.bulk_tracker is None:
+            return {}
+        tracker, self.bulk_tracker = self.bulk_tracker, None
+        if tracker.pending_count:
+            p.print_info(f"Ожидание выполнения {tracker.pending_count} подписок в Close...")
+        results = tracker.finish()
+        if not results:
+            return {}
+
+        enrolled = sum(result.n_processed or 0 for result in results)
+        failed = sum(result.n_failed or 0 for result in results)
+        unfinished = sum(1 for result in results if result.status == UNFINISHED)
+        message = f"📨 Подписки выполнены в Close: подписано лидов {enrolled}, не подписано {failed}"
+        if unfinished:
+            message += f", не завершено задач {unfinished}"
+        p.print_info(message)
+        logger.info(self.log_prefix + message)
+
+        if Config.BULK_REPORT_SHEET:
+            try:
+                self.f.add_report_to_sheet(
+                    spread=self.tenant.report_spread,
+                    sheet=Config.BULK_REPORT_SHEET,
+                    report=[self._bulk_report_row(result) for result in results],
+                    header=BULK_REPORT_HEADER
+                )
+            except Exception as e:
+                p.print_error(f"Ошибка выгрузки итогов подписок: {str(e)}")
+        return {'bulk_enrolled': enrolled, 'bulk_failed': failed, 'bulk_unfinished': unfinished}
 
-                try:
-                    result = self.process_single_subscription(row, seqID_dict)
-                    report.append(result)
+    def _bulk_report_row(self, result):
+        """Строка листа итогов bulk action"""
+        def cell(value):
+            return '' if value is None else value
+        return [
+            dt.now().strftime("%m/%d/%Y, %H:%M:%S"),
+            result.bulk_id,
+            result.row.sheet_name.replace(self.tenant.sheet_prefix, ''),
+            result.row.seq_name,
+            result.row.email,
+            result.status,
+            cell(result.n_objects),
+            cell(result.n_processed),
+            cell(result.n_failed),
+        ]
 
-                    if any(error_indicator in str(result[-1]).lower() for error_indicator in
-                           ['error', 'не найден', 'exception']) or "нет" in str(result[-2]).lower():
-                        error_count += 1
-                    else:
-                        success_count += 1
+    def _pacing_sleep(self, seconds):
+        """Пауза между подписками одного ящика с учетом в метриках"""
+        PACING_SECONDS.inc(seconds)
+        self.sleep(seconds)
 
-                    # Случайная задержка 2-5 секунд
-                    if i < total_count - 1:
-                        delay = random.uniform(Config.SUBSCRIPTION_DELAY_MIN, Config.SUBSCRIPTION_DELAY_MAX)
-                        time.sleep(delay)
+    def _write_summary(self, started, success, message, **counts):
+        """Сохраняет JSON-сводку запуска (длительность, счетчики, метрики)"""
+        try:
+            write_run_summary(
+                tenant_path(Config.METRICS_SUMMARY_FILE, self.tenant),
+                tenant=self.tenant.name,
+                finished_at=dt.now().isoformat(timespec='seconds'),
+                duration_seconds=round(time.perf_counter() - started, 3),
+                success=success,
+                message=message,
+                search_cache={'hits': self.search_cache.hits, 'misses': self.search_cache.misses},
+                sheet_cache={'hits': self.sheet_cache.hits, 'misses': self.sheet_cache.misses},
+                **counts
+            )
+        except Exception as e:
+            p.print_warning(f"Не удалось сохранить сводку запуска: {str(e)}")
 
-                except Exception as e:
-                    error_count += 1
-                    p.print_error(f"Критическая ошибка при обработке {row['email']}: {str(e)}")
-                    date_time = dt.now().strftime("%m/%d/%Y, %H:%M:%S")
-                    report.append([
-                        date_time,
-                        row['url'],
-                        row['sheet_name'].replace(Config.SHEET_PREFIX, ''),
-                        row['seq_name'],
-                        row['email'],
-                        f"critical_error: {str(e)}",
-                        "Не удалось обработать подписку"
-                    ])
+    def _report_row(self, row, total_leads, bulk_response):
+        """Строка отчета по строке энроллинга"""
+        date_time = dt.now().strftime("%m/%d/%Y, %H:%M:%S")
+        return [
+            date_time,
+            row.url,
+            row.sheet_name.replace(self.tenant.sheet_prefix, ''),
+            row.seq_name,
+            row.email,
+            total_leads,
+            bulk_response,
+        ]
 
-            # Анализ результатов и сохранение отчета
-            self._save_report(report)
-            self.write_error_log(self.acc_errors)
-            return self._analyze_results(success_count, error_count, total_count)
+    def dedupe(self, enrolling_reg):
+        """Удаляет повторы строк между листами и предупреждает о конфликтующих фильтрах"""
+        dedup = dedupe_rows(enrolling_reg)
+        if dedup.duplicates or dedup.conflicts:
+            p.print_warning(dedup.summary())
+        if dedup.conflicts:
+            conflicts = '\n'.join(f"{email} -> {seq_name}: разных фильтров {len(rows)}"
+                                  for (email, seq_name), rows in dedup.conflicts.items())
+            logger.warning(self.log_prefix + f"⚠️ Один ящик и цепочка с разными фильтрами:\n{conflicts}")
+        return dedup
+
+    def _duplicate_result(self, duplicate):
+        """Строка отчета для удаленного дубля"""
+        kept_sheet = duplicate.kept.sheet_name.replace(self.tenant.sheet_prefix, '')
+        return self._report_row(duplicate.row, 'дубль', f"дубль строки листа {kept_sheet}, не выполнялась")
+
+    def _rejected_result(self, rejected):
+        """Строка отчета для строки, отклоненной при планировании"""
+        p.print_error(f"{rejected.row.sheet_name}: {rejected.row.email} - {rejected.reason}")
+        return self._report_row(rejected.row, f'НЕТ\n{rejected.reason}', rejected.reason), True
+
+    def _journal_key(self, entry):
+        """Ключ строки плана в журнале запусков"""
+        filter_key = getattr(entry, 'filter_hash', None) or row_filter_key(entry.row)
+        return journal_key(self.journal.day, entry.row, filter_key)
+
+    def _record_once(self, entry, index, result, is_error, status):
+        """
+        Записывает в журнал, отчет и историю строку, не требующую запросов (отклоненную или дубль),
+        если ее исход еще не записан сегодня
+        :return: True - строка записана, False - уже была в журнале
+        """
+        key = self._journal_key(entry)
+        if self.journal.is_recorded(key):
+            return False
+        entry_id = self.journal.record(key, index, result, is_error)
+        self.report_writer.add(entry_id, result)
+        self._record_history(result, status, index)
+        return True
+
+    def _process_item(self, item):
+        """
+        Обрабатывает подписку, записывает исход в журнал и возвращает строку отчета и исход
+        (success, error или skipped - строка пропущена разомкнутой цепью)
+        """
+        mailbox = normalize_email(item.account['email'])
+        skip_reason = self.breakers.admit(mailbox) if self.breakers is not None else None
+        if skip_reason:
+            # Пропущенная строка записывается в журнал как ошибка и будет обработана при следующем запуске
+            result = self._report_row(item.row, 'пропущено', f"Не выполнялась: {skip_reason}")
+            entry_id = self.journal.record(self._journal_key(item), item.index, result, True)
+            self.report_writer.add(entry_id, result)
+            self._record_history(result, 'skipped', item.index)
+            SUBSCRIPTIONS.inc(tenant=self.tenant.name, outcome='skipped')
+            return result, 'skipped'
+
+        try:
+            result, error = self.process_single_subscription(item)
+            is_error = (any(error_indicator in str(result[-1]).lower() for error_indicator in
+                            ['error', 'не найден', 'exception']) or "нет" in str(result[-2]).lower())
 
         except Exception as e:
-            error_msg = f"Критическая ошибка в основном процессе: {str(e)}"
-            p.print_error(error_msg)
-            logger.error(f"🔴 ENROLLING CRITICAL: {error_msg}")
-            return False, f"Process error: {str(e)}"
+            p.print_error(f"Критическая ошибка при обработке {item.row.email}: {str(e)}")
+            result = self._report_row(item.row, f"critical_error: {str(e)}", "Не удалось обработать подписку")
+            error = e
+            is_error = True
+
+        if self.breakers is not None:
+            error_class = classify_error(error, item.account)[0] if error is not None else None
+            self.breakers.record(mailbox, error_class if error_class or not is_error else 'unknown')
+
+        outcome = 'error' if is_error else 'success'
+        entry_id = self.journal.record(self._journal_key(item), item.index, result, is_error)
+        self.report_writer.add(entry_id, result)
+        self._record_history(result, outcome, item.index)
+        SUBSCRIPTIONS.inc(tenant=self.tenant.name, outcome=outcome)
+        return result, outcome
+
+    def _breaker_changed(self, scope, breaker):
+        """Сообщает о размыкании, замыкании и остановке цепи"""
+        target = "Обработка" if scope == 'global' else f"Ящик {breaker.name}"
+        if breaker.state == STOPPED:
+            message = f"🔴 {target}: цепь остановлена ({breaker.reason}), оставшиеся строки пропускаются"
+            (logger.error if scope == 'global' else logger.warning)(self.log_prefix + message)
+        elif breaker.state == 'open':
+            message = (f"⚠️ {target}: цепь разомкнута ({breaker.reason}), "
+                       f"пробная подписка через {breaker.cooldown * 2 ** breaker.failed_probes} с")
+            (logger.error if scope == 'global' else logger.warning)(self.log_prefix + message)
+        else:
+            message = f"✅ {target}: пробная подписка успешна, обработка продолжается"
+            logger.info(self.log_prefix + message)
+        p.print_warning(message)
+
+    def _append_report_rows(self, rows):
+        """Дописывает строки на лист отчета"""
+        self.f.add_report_to_sheet(
+            spread=self.tenant.report_spread,
+            sheet=Config.REPORT_SHEET,
+            report=rows
+        )
 
-    def _save_report(self, report):
-        """Сохраняет отчет в Google Sheets"""
-        if len(report) > 1:
-            self.f.add_report_to_sheet(
-                spread=Config.SPREAD_NAME,
-                sheet='enrolling_pyReport',
-                report=report[1:]
+    def _record_history(self, report_row, status, plan_index=None):
+        """Сохраняет строку отчета в историю запусков; ошибка истории не прерывает обработку"""
+        try:
+            self.history.record_report_row(self.run_id, report_row, status, plan_index)
+        except Exception as e:
+            p.print_warning(f"Не удалось сохранить строку в историю: {str(e)}")
+
+    def _import_report_sheet(self):
+        """Один раз переносит в историю строки, выгруженные на лист отчета до ее появления"""
+        if not Config.REPORT_VIEW_DAYS or self.history.report_sheet_imported:
+            return
+        try:
+            rows = self.f.get_sheet_range(self.tenant.report_spread, Config.REPORT_SHEET, 'A:G')
+            count = self.history.import_report_rows(rows)
+            p.print_info(f"Строки листа {Config.REPORT_SHEET} перенесены в историю: {count}")
+        except Exception as e:
+            p.print_warning(f"Не удалось перенести лист {Config.REPORT_SHEET} в историю: {str(e)}")
+
+    def _render_report_view(self):
+        """
+        Перезаписывает лист отчета строками истории за последние REPORT_VIEW_DAYS дней.
+        Пока старые строки листа не перенесены в историю, лист только дописывается
+        """
+        if not Config.REPORT_VIEW_DAYS or not self.history.report_sheet_imported:
+            return
+        try:
+            rows = self.history.report_view(Config.REPORT_VIEW_DAYS)
+            self.f.write_spread_sheet(
+                spread=self.tenant.report_spread,
+                sheet=Config.REPORT_SHEET,
+                report=[REPORT_HEADER] + rows
             )
-            p.print_success("Отчет успешно сохранен")
+            p.print_info(f"Лист {Config.REPORT_SHEET}: {len(rows)} строк за {Config.REPORT_VIEW_DAYS} дней")
+        except Exception as e:
+            p.print_error(f"Ошибка обновления листа {Config.REPORT_SHEET} из истории: {str(e)}")
+
+    def _save_report(self):
+        """Завершает выгрузку отчета: остаток буфера и строки журнала, не выгруженные ранее"""
+        flushed = self.report_writer.close()
+        if flushed:
+            # Строки, вытесненные из буфера при недоступности таблицы, остались в журнале
+            for entry_id, report_row in self.journal.pending_report_rows():
+                self.report_writer.add(entry_id, report_row)
+            flushed = self.report_writer.close()
+
+        if not flushed:
+            p.print_error("Не удалось выгрузить часть отчета, строки сохранены в журнале до следующего запуска")
+        elif self.report_writer.flushed_count:
+            p.print_success(f"Отчет успешно сохранен: {self.report_writer.flushed_count} строк")
         else:
             p.print_warning("Нет данных для отчета")
+        self._render_report_view()
 
-    def _analyze_results(self, success_count, error_count, total_count):
+    def _analyze_results(self, success_count, error_count, total_count, skipped_count=0, bulk_counts=None):
         """Анализирует результаты выполнения"""
-        p.print_info(f"Результаты: {success_count} успешно, {error_count} ошибок")
+        skipped_text = f"\nПропущено размыкателем цепи: {skipped_count}" if skipped_count else ''
+        # Итоги bulk action: сколько лидов Close действительно подписал
+        bulk_text = ''
+        if bulk_counts:
+            bulk_text = (f"\nЛидов подписано в Close: {bulk_counts['bulk_enrolled']}, "
+                         f"не подписано: {bulk_counts['bulk_failed']}")
+            if bulk_counts['bulk_unfinished']:
+                bulk_text += f", не завершено задач: {bulk_counts['bulk_unfinished']}"
+        p.print_info(f"Результаты: {success_count} успешно, {error_count} ошибок" +
+                     (f", {skipped_count} пропущено" if skipped_count else ''))
+
+        # Остановка размыкателем - критическая ошибка: пропущенные строки выполнит перезапуск
+        if self.breakers is not None and self.breakers.stopped:
+            reason = self.breakers.global_breaker.reason
+            error_msg = (f"Обработка остановлена размыкателем цепи ({reason}). Успешно: {success_count}, "
+                         f"Ошибок: {error_count}, Пропущено: {skipped_count} из {total_count}")
+            p.print_error(error_msg)
+            logger.error(self.log_prefix + f"🔴 ENROLLING CRITICAL: {error_msg}\n{self.breakers.summary()}")
+            return False, f"Circuit breaker stopped processing: {reason}"
 
         if total_count > 0:
             error_ratio = error_count / total_count
             if error_ratio >= Config.ERROR_THRESHOLD:
                 error_msg = f"КРИТИЧЕСКИЙ УРОВЕНЬ ОШИБОК! Успешно: {success_count}, Ошибок: {error_count} из {total_count} ({error_ratio:.1%})"
                 p.print_error(error_msg)
-                logger.error(f"🔴 ENROLLING CRITICAL: {error_msg}")
+                logger.error(self.log_prefix + f"🔴 ENROLLING CRITICAL: {error_msg}")
 
-                stats_message = f"📊 Статистика энроллинга (КРИТИЧЕСКИЙ УРОВЕНЬ):\nУспешных подписок: {success_count} из {total_count}\nОшибок: {error_count}"
-                logger.error(stats_message)
+                stats_message = f"📊 Статистика энроллинга (КРИТИЧЕСКИЙ УРОВЕНЬ):\nУспешных подписок: {success_count} из {total_count}\nОшибок: {error_count}{skipped_text}{bulk_text}"
+                logger.error(self.log_prefix + stats_message)
 
                 return False, f"Critical error threshold reached: {error_ratio:.1%}"
             else:
-                stats_message = f"✅ Энроллинг завершен успешно!\nУспешных подписок: {success_count} из {total_count}\nОшибок: {error_count}"
+                stats_message = f"✅ Энроллинг завершен успешно!\nУспешных подписок: {success_count} из {total_count}\nОшибок: {error_count}{skipped_text}{bulk_text}"
                 p.print_success(stats_message)
-                logger.info(stats_message)
+                logger.info(self.log_prefix + stats_message)
         else:
             p.print_warning("Нет подписок для обработки")
-            logger.warning("⚠️ Нет подписок для обработки")
+            logger.warning(self.log_prefix + "⚠️ Нет подписок для обработки")
 
-        self.last_run_date = dt.now().strftime("%Y-%m-%d")
+        self.last_run_date = self.schedule.now().date().isoformat()
         return True, f"Success: {success_count}/{total_count}"
 
-    def create_error_log_row(self, email_account, error_text):
+    def create_error_log_row(self, email_account, error):
         """Создает строку журнала ошибок"""
-        if "identity does not exist" in error_text:
-            error_type = "identity does not exist"
-            info = f"identities: {email_account['identities']}"
-        for user in self.users:
-            if user['id'] == email_account['user_id']:
-                user_name = user['first_name'] + ' ' + user['last_name']
-                break
-        log_row = [
-            user_name,
+        error_type, info = classify_error(error, email_account)
+        return [
+            self.users.full_name(email_account.get('user_id')),
             email_account['email'],
             email_account['id'],
             error_type,
             info,
         ]
-        return log_row
 
     def write_error_log(self, error_rows):
+        if error_rows:
+            try:
+                self.history.record_account_errors(self.run_id, error_rows)
+            except Exception as e:
+                p.print_warning(f"Не удалось сохранить ошибки ящиков в историю: {str(e)}")
         error_report = [['Close User', 'Account Email', 'Account ID', 'Error', 'Info']]
         if error_rows:
             error_report.extend(error_rows)
         else:
             error_report.append(['ошибок нет', '', '', '', ''])
         self.f.write_spread_sheet(
-            spread=Config.SPREAD_NAME,
+            spread=self.tenant.report_spread,
             sheet='error_accts',
             report=error_report
         )
 
-    def process_single_subscription(self, row, seqID_dict):
-        """Обрабатывает одну подписку"""
-        p.print_info(f"Обработка: {row['url']} -> {row['email']}")
-
-        query = json.loads(row['filters_json'])
+    def process_single_subscription(self, item):
+        """
+        Обрабатывает одну подписку из плана
+        :return: кортеж (строка отчета, исключение подписки или None)
+        """
+        row = item.row
+        p.print_info(f"Обработка: {row.url} -> {row.email}")
 
         # Поиск лидов с таймаутом
         try:
-            search_response = self.api_client.search_leads(query)
+            search_response = self.api_client.search_leads(item.query)
             total_leads = search_response['count']['total']
             p.print_success(f"Найдено лидов: {total_leads}")
         except Exception as e:
             total_leads = f"search_error: {str(e)}"
             p.print_error(f"Ошибка поиска: {str(e)}")
 
-        # Поиск ресурсов
-        emailacct = self.f.find_emailacct_by_email(row['email'])
-        sequence_id = seqID_dict[row['seq_name']]
-
-        bulk_response = ''
-
-        # Проверка наличия ресурсов
-        if not emailacct and not sequence_id:
-            bulk_response = f"ящик {row['email']} не найден, цепочка {row['seq_name']} не найдена"
-            total_leads = f'НЕТ\n{bulk_response}'
-            p.print_error(bulk_response)
-        elif not emailacct:
-            bulk_response = f"ящик {row['email']} не найден"
-            total_leads = f'НЕТ\n{bulk_response}'
-            p.print_error(bulk_response)
-        elif not sequence_id:
-            bulk_response = f"цепочка {row['seq_name']} не найдена"
-            total_leads = f'НЕТ\n{bulk_response}'
-            p.print_error(bulk_response)
-        else:
-            # Все ресурсы найдены - выполняем подписку
-            sender_name = None
-            for item in emailacct['identities']:
-                if item['email'].lower() == row['email'].lower():
-                    sender_name = item['name']
-                    break
-
-            data = {
-                "action_type": "subscribe",
-                "sequence_id": sequence_id,
-                "send_done_email": False,
-                "sender_account_id": emailacct['id'],
-                "sender_email": emailacct['email'],
-                "contact_preference": "lead",
-                "s_query": query['query'],
-                "sort": query['sort'],
-                "results_limit": query['results_limit'],
-            }
-
-            if sender_name:
-                data["sender_name"] = sender_name
-
-            try:
-                resp = self.api_client.subscribe_sequence(data)
-                bulk_response = "Успешно"
-                p.print_success(f"Подписка выполнена: {row['email']} -> {row['seq_name']}")
-            except Exception as e:
-                bulk_response = str(e)
-                total_leads = f"error\n{bulk_response}"
-                p.print_error(f"Ошибка подписки: {str(e)}")
-                log_row = self.create_error_log_row(emailacct, str(e))
+        emailacct = item.account
+        data = {
+            "action_type": "subscribe",
+            "sequence_id": item.sequence_id,
+            "send_done_email": False,
+            "sender_account_id": emailacct['id'],
+            "sender_email": emailacct['email'],
+            "contact_preference": "lead",
+            "s_query": item.query['query'],
+            "sort": item.query['sort'],
+            "results_limit": item.query['results_limit'],
+        }
+
+        if item.sender_name:
+            data["sender_name"] = item.sender_name
+
+        error = None
+        try:
+            resp = self.api_client.subscribe_sequence(data)
+            bulk_response = "Успешно"
+            if self.bulk_tracker is not None and isinstance(resp, dict):
+                self.bulk_tracker.track(resp.get('id'), row)
+            p.print_success(f"Подписка выполнена: {row.email} -> {row.seq_name}")
+        except Exception as e:
+            error = e
+            bulk_response = str(e)
+            total_leads = f"error\n{bulk_response}"
+            p.print_error(f"Ошибка подписки: {str(e)}")
+            log_row = self.create_error_log_row(emailacct, e)
+            with self._errors_lock:
                 self.acc_errors.append(log_row)
 
-        date_time = dt.now().strftime("%m/%d/%Y, %H:%M:%S")
-        return [
-            date_time,
-            row['url'],
-            row['sheet_name'].replace(Config.SHEET_PREFIX, ''),
-            row['seq_name'],
-            row['email'],
-            total_leads,
-            bulk_response,
-        ]
+        return self._report_row(row, total_leads, bulk_response), error
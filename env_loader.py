@@ -1,6 +1,8 @@
 from dotenv import load_dotenv
 import os
 
+_secrets_path = None
+
 
 def get_secrets_path():
     """Определяет корректный путь к секретам"""
@@ -13,13 +15,19 @@ def get_secrets_path():
 
 
 def setup_environment():
-    """Настраивает переменные окружения"""
-    secrets_path = get_secrets_path()
-    env_file_path = os.path.join(secrets_path, '.env')
-    load_dotenv(env_file_path)
+    """Настраивает переменные окружения (один раз, при первом вызове)"""
+    global _secrets_path
+    if _secrets_path is None:
+        secrets_path = get_secrets_path()
+        env_file_path = os.path.join(secrets_path, '.env')
+        load_dotenv(env_file_path)
+        _secrets_path = secrets_path
 
-    return secrets_path
+    return _secrets_path
 
 
-# Инициализация при импорте модуля
-SECRETS_PATH = setup_environment()
+def __getattr__(name):
+    # SECRETS_PATH вычисляется при первом обращении, а не при импорте модуля
+    if name == 'SECRETS_PATH':
+        return setup_environment()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+import json
+from collections import namedtuple
+
+ErrorType = namedtuple('ErrorType', ['name', 'info'])
+
+
+def _identities_info(account, message):
+    return f"identities: {account.get('identities')}"
+
+
+def _message_info(account, message):
+    return message
+
+
+# Известные сообщения об ошибках Close (нормализованный текст -> тип ошибки)
+MESSAGE_TYPES = {
+    'identity does not exist': ErrorType('identity does not exist', _identities_info),
+}
+
+# Типы ошибок по HTTP статусу, если сообщение не распознано
+STATUS_TYPES = {
+    400: ErrorType('invalid request', _message_info),  # ошибка данных строки, например фильтра s_query
+    401: ErrorType('unauthorized', _message_info),
+    403: ErrorType('forbidden', _message_info),
+    404: ErrorType('not found', _message_info),
+    429: ErrorType('rate limited', _message_info),
+    500: ErrorType('server error', _message_info),
+    502: ErrorType('server error', _message_info),
+    503: ErrorType('server error', _message_info),
+    504: ErrorType('server error', _message_info),
+}
+
+UNKNOWN_ERROR = ErrorType('unknown', _message_info)
+
+
+def normalize_message(message):
+    return str(message).strip().rstrip('.').lower()
+
+
+def parse_error(error):
+    """
+    Разбирает ошибку Close API
+    :param error: исключение (APIError с response) или текст ошибки
+    :return: кортеж (HTTP статус или None, список сообщений)
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    text = response.text if response is not None else str(error)
+
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return status, [text]
+    if not isinstance(payload, dict):
+        return status, [text]
+
+    messages = []
+    if payload.get('error'):
+        messages.append(payload['error'])
+    messages.extend(payload.get('errors') or [])
+    for value in (payload.get('field-errors') or {}).values():
+        messages.extend(value if isinstance(value, list) else [value])
+    return status, [m if isinstance(m, str) else json.dumps(m, ensure_ascii=False) for m in messages] or [text]
+
+
+def classify_error(error, account=None):
+    """
+    Определяет тип ошибки по таблицам MESSAGE_TYPES и STATUS_TYPES
+    :param error: исключение или текст ошибки
+    :param account: ящик Close, к которому относится ошибка
+    :return: кортеж (тип ошибки, дополнительная информация)
+    """
+    status, messages = parse_error(error)
+    account = account or {}
+
+    for message in messages:
+        error_type = MESSAGE_TYPES.get(normalize_message(message))
+        if error_type:
+            return error_type.name, error_type.info(account, message)
+
+    error_type = STATUS_TYPES.get(status, UNKNOWN_ERROR)
+    return error_type.name, error_type.info(account, '; '.join(messages))
@@ -1,98 +1,98 @@
-from closeio_api import Client
-import gspread
-from gspread.utils import rowcol_to_a1
-from env_loader import SECRETS_PATH
-import os
-
-SERVICE_ACCOUNT_FILE = os.path.join(SECRETS_PATH, 'service_account.json')
-gc = gspread.service_account(filename=SERVICE_ACCOUNT_FILE)
-api_key = os.getenv('CLOSE_API_KEY_MARY')
-api = Client(api_key)
-
-
-def get_sheet_titles(spreadsheet_name):
-    # Открытие таблицы по названию
-    spreadsheet = gc.open(spreadsheet_name)
-
-    # Получение списка всех листов и их названий
-    sheet_titles = [sheet.title for sheet in spreadsheet.worksheets()]
-
-    return sheet_titles
-
-
-def find_sequence_by_name(sequence_name):
-    target_seq = None
-    skip = 0
-    flag = True
-    while flag:
-        params = {'_skip': skip}
-        resp = api.get('sequence', params=params)
-        seqs = resp['data']
-        skip += 100
-        for seq in seqs:
-            if seq['name'].lower() == sequence_name.strip().lower():
-                target_seq = seq
-                break
-        if resp['has_more'] == False:
-            flag = False
-    return target_seq
-
-
-def find_emailacct_by_email(email):
-    emailaccts = api.get('connected_account')['data']
-    filtered_accts = [acct for acct in emailaccts if acct.get('email').lower() == email.lower().strip()]
-    target_acct = None
-    for acct in filtered_accts:
-        if acct.get('send_status') == 'ok':
-            target_acct = acct
-            break
-    return target_acct
-
-
-def get_sheet_range(spread, income_sheet, income_range):
+from functools import partial
+from types import SimpleNamespace
+from services import LazyService, get_services
+
+# Клиенты создаются при первом использовании, импорт модуля не обращается к сети
+gc = LazyService('gc')
+api = LazyService('api')
+
+
+def get_async_api(services=None):
+    """Асинхронный клиент Close API для параллельных запросов (см. async_client.py)"""
+    return (services or get_services()).async_api()
+
+
+def open_spreadsheet(spread, services=None):
+    """Открывает гугл-таблицу по названию один раз и переиспользует дескриптор"""
+    services = services or get_services()
+    spreadsheets = services.spreadsheets
+    sh = spreadsheets.get(spread)
+    if sh is None:
+        sh = services.gc.open(spread)
+        spreadsheets[spread] = sh
+    return sh
+
+
+def get_sheet_range(spread, income_sheet, income_range, services=None):
     """Получает из гугл-таблицы диапазон"""
-    sh = gc.open(spread)
+    sh = open_spreadsheet(spread, services)
     data = sh.worksheet(income_sheet).get(income_range)
     return data
 
 
-def add_report_to_sheet(spread, sheet, report):
+def get_sheets_ranges(spread, sheet_names, income_range, services=None):
     """
-    Добавляет на лист данные отчета без удаления уже существующих там записей
+    Получает один и тот же диапазон с нескольких листов одним запросом values:batchGet
     :param spread: гугл таблица (название)
-    :param sheet: название листа
-    :param report: отчет в виде списка списков
-    :return: None
+    :param sheet_names: список названий листов
+    :param income_range: диапазон в A1-нотации без названия листа, например "A:C"
+    :param services: контейнер клиентов (по умолчанию глобальный)
+    :return: словарь название листа -> список строк
     """
-    sh = gc.open(spread)
-    worksheet = sh.worksheet(sheet)
+    if not sheet_names:
+        return {}
+    from gspread.utils import absolute_range_name
 
-    # Получить размеры отчета (количество строк и столбцов)
-    num_rows = len(report)
-    num_cols = len(report[0])
+    sh = open_spreadsheet(spread, services)
+    ranges = [absolute_range_name(sheet_name, income_range) for sheet_name in sheet_names]
+    resp = sh.values_batch_get(ranges)
+    value_ranges = resp.get('valueRanges', [])
+    # valueRanges возвращаются в порядке запрошенных диапазонов
+    return {sheet_name: value_range.get('values', [])
+            for sheet_name, value_range in zip(sheet_names, value_ranges)}
 
-    # Получить диапазон для записи данных
-    q_rows = len(worksheet.get_all_values())  # узнаем кол-во уже заполненных на листе строк
 
-    start_cell = rowcol_to_a1(q_rows + 1, 1)
-    end_cell = rowcol_to_a1(q_rows + num_rows, num_cols)
-
-    # Записать значения в диапазон
-    cell_range = f"{start_cell}:{end_cell}"
-    worksheet.update(cell_range, report, value_input_option="USER_ENTERED")
+def add_report_to_sheet(spread, sheet, report, services=None, header=None):
+    """
+    Добавляет на лист данные отчета без удаления уже существующих там записей.
+    Строки дописываются запросом values:append в пустые строки под таблицей, без чтения
+    содержимого листа; новые строки сетки добавляются, только если пустых не осталось
+    :param spread: гугл таблица (название)
+    :param sheet: название листа
+    :param report: отчет в виде списка списков
+    :param services: контейнер клиентов (по умолчанию глобальный)
+    :param header: строка заголовка; если задана, отсутствующий лист создается с ней
+    :return: None
+    """
+    from gspread.exceptions import WorksheetNotFound
+
+    sh = open_spreadsheet(spread, services)
+    try:
+        worksheet = sh.worksheet(sheet)
+    except WorksheetNotFound:
+        if header is None:
+            raise
+        worksheet = sh.add_worksheet(title=sheet, rows=1, cols=len(header))
+        report = [header] + list(report)
+        print(f"Лист {sheet} создан в таблице {spread}")
+    worksheet.append_rows(report, value_input_option="USER_ENTERED")
 
     print("Отчет добавлен")
 
 
-def write_spread_sheet(spread, sheet, report):
+def write_spread_sheet(spread, sheet, report, services=None):
     """
-    Очищает лист гугл таблицы и записывает на него отчет
+    Очищает лист гугл таблицы и записывает на него отчет.
+    Сетка листа сокращается до размера отчета: clear() удаляет только значения
     :param spread: гугл таблица (название)
     :param sheet: название листа
     :param report: отчет в виде списка списков
+    :param services: контейнер клиентов (по умолчанию глобальный)
     :return: None
     """
-    sh = gc.open(spread)
+    from gspread.utils import rowcol_to_a1
+
+    sh = open_spreadsheet(spread, services)
     worksheet = sh.worksheet(sheet)
     worksheet.clear()
     print(f"Лист {sheet} в таблице {spread} очищен")
@@ -108,3 +108,25 @@ def write_spread_sheet(spread, sheet, report):
     # Записать значения в диапазон
     cell_range = f"{start_cell}:{end_cell}"
     worksheet.update(report, cell_range, value_input_option="user_entered")
+    if worksheet.row_count != num_rows:
+        worksheet.resize(rows=num_rows)
+
+
+def bind(services):
+    """
+    Функции модуля, привязанные к контейнеру клиентов арендатора.
+    Возвращает объект с тем же интерфейсом, что и модуль (api, gc, get_sheet_range, ...)
+    :param services: ServiceContainer арендатора
+    :return: SimpleNamespace
+    """
+    return SimpleNamespace(
+        gc=LazyService('gc', services),
+        api=LazyService('api', services),
+        services=services,
+        get_async_api=partial(get_async_api, services=services),
+        open_spreadsheet=partial(open_spreadsheet, services=services),
+        get_sheet_range=partial(get_sheet_range, services=services),
+        get_sheets_ranges=partial(get_sheets_ranges, services=services),
+        add_report_to_sheet=partial(add_report_to_sheet, services=services),
+        write_spread_sheet=partial(write_spread_sheet, services=services),
+    )
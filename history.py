@@ -0,0 +1,311 @@
+import os
+import sys
+import sqlite3
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from config import Config
+
+# Формат даты в первой колонке листа отчета
+REPORT_TIME_FORMAT = "%m/%d/%Y, %H:%M:%S"
+REPORT_HEADER = ['Date', 'URL', 'Sheet', 'Sequence', 'Email', 'Total leads', 'Result']
+
+# Исходы строк отчета
+STATUSES = ('success', 'error', 'rejected', 'duplicate', 'skipped')
+SUMMARY_COLUMNS = ('email', 'sequence', 'sheet')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_rows (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    url TEXT,
+    sheet TEXT,
+    sequence TEXT,
+    email TEXT,
+    total_leads INTEGER,
+    leads_info TEXT,
+    result TEXT,
+    status TEXT NOT NULL,
+    plan_index INTEGER
+);
+CREATE INDEX IF NOT EXISTS report_rows_day ON report_rows (day);
+CREATE INDEX IF NOT EXISTS report_rows_email ON report_rows (email, day);
+CREATE INDEX IF NOT EXISTS report_rows_sequence ON report_rows (sequence, day);
+CREATE INDEX IF NOT EXISTS report_rows_status ON report_rows (status, day);
+
+CREATE TABLE IF NOT EXISTS account_errors (
+    id INTEGER PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    recorded_at TEXT NOT NULL,
+    close_user TEXT,
+    email TEXT,
+    account_id TEXT,
+    error TEXT,
+    info TEXT
+);
+CREATE INDEX IF NOT EXISTS account_errors_day ON account_errors (day);
+CREATE INDEX IF NOT EXISTS account_errors_email ON account_errors (email, day);
+CREATE INDEX IF NOT EXISTS account_errors_error ON account_errors (error, day);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def new_run_id():
+    return datetime.now().strftime('%Y%m%dT%H%M%S%f')
+
+
+def parse_report_time(value):
+    """Время строки отчета или None, если в ячейке не дата (например, заголовок)"""
+    try:
+        return datetime.strptime(str(value), REPORT_TIME_FORMAT)
+    except ValueError:
+        return None
+
+
+def classify_report_row(report_row):
+    """
+    Исход строки отчета по ее тексту (для строк, выгруженных до появления истории)
+    :return: одно из STATUSES
+    """
+    total_leads, result = (list(report_row) + ['', ''])[5:7]
+    if str(total_leads) == 'дубль':
+        return 'duplicate'
+    if str(total_leads) == 'пропущено':
+        return 'skipped'
+    if str(total_leads).startswith('НЕТ\n'):
+        return 'rejected'
+    if (any(indicator in str(result).lower() for indicator in ['error', 'не найден', 'exception'])
+            or "нет" in str(total_leads).lower()):
+        return 'error'
+    return 'success'
+
+
+class RunHistory:
+    """
+    История запусков в SQLite: строки отчета и ошибки ящиков за все дни, с индексами
+    по дате, ящику, цепочке и исходу. Лист отчета в таблице - окно последних дней этой истории.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = Config.HISTORY_DB if db_path is None else db_path
+        self._lock = threading.Lock()
+        if self.db_path:
+            os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(self.db_path or ':memory:', check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(report_rows)")}
+        if 'plan_index' not in columns:
+            # База создана до появления порядка строк плана
+            self._db.execute("ALTER TABLE report_rows ADD COLUMN plan_index INTEGER")
+        self._db.commit()
+
+    def _insert_report_rows(self, run_id, rows):
+        values = []
+        for report_row, status, plan_index in rows:
+            if status not in STATUSES:
+                raise ValueError(f"Неизвестный исход строки отчета: {status}")
+            date_time, url, sheet, sequence, email, total_leads, result = (list(report_row) + [''] * 7)[:7]
+            recorded = parse_report_time(date_time) or datetime.now()
+            is_count = isinstance(total_leads, int) and not isinstance(total_leads, bool)
+            values.append((
+                run_id, recorded.date().isoformat(), recorded.isoformat(sep=' ', timespec='seconds'),
+                url, sheet, sequence, email,
+                total_leads if is_count else None, None if is_count else str(total_leads),
+                str(result), status, plan_index,
+            ))
+        self._db.executemany(
+            "INSERT INTO report_rows (run_id, day, recorded_at, url, sheet, sequence, email, "
+            "total_leads, leads_info, result, status, plan_index) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            values
+        )
+
+    def record_report_row(self, run_id, report_row, status, plan_index=None):
+        """
+        Сохраняет строку отчета
+        :param run_id: id запуска
+        :param report_row: строка отчета [дата, url, лист, цепочка, ящик, лидов, результат]
+        :param status: исход строки (см. STATUSES)
+        :param plan_index: позиция строки в плане запуска (порядок строк в отчете)
+        :return: None
+        """
+        with self._lock:
+            self._insert_report_rows(run_id, [(report_row, status, plan_index)])
+            self._db.commit()
+
+    def record_account_errors(self, run_id, error_rows):
+        """
+        Сохраняет строки журнала ошибок ящиков
+        :param error_rows: строки [пользователь Close, ящик, id ящика, ошибка, пояснение]
+        :return: None
+        """
+        now = datetime.now()
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO account_errors (run_id, day, recorded_at, close_user, email, account_id, error, info) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, now.date().isoformat(), now.isoformat(sep=' ', timespec='seconds'),
+                  *(list(row) + [''] * 5)[:5]) for row in error_rows]
+            )
+            self._db.commit()
+
+    def import_report_rows(self, rows):
+        """
+        Переносит строки существующего листа отчета в историю (один раз, при переходе на историю).
+        Строки без даты в первой колонке пропускаются, исход определяется по тексту строки
+        :return: число перенесенных строк
+        """
+        rows = [row for row in rows if row and parse_report_time(row[0])]
+        with self._lock:
+            self._insert_report_rows('import', [(row, classify_report_row(row), None) for row in rows])
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('report_sheet_imported', ?)",
+                             (datetime.now().isoformat(timespec='seconds'),))
+            self._db.commit()
+        return len(rows)
+
+    @property
+    def report_sheet_imported(self):
+        """Строки листа отчета уже перенесены в историю"""
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM meta WHERE key = 'report_sheet_imported'").fetchone() is not None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def report_view(self, days=None):
+        """
+        Строки отчета за последние days дней в формате листа отчета.
+        Строки упорядочены по запускам и позиции в плане запуска, перенесенные с листа - первыми
+        :return: список строк отчета, от старых к новым
+        """
+        days = Config.REPORT_VIEW_DAYS if days is None else days
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._query(
+            "SELECT recorded_at, url, sheet, sequence, email, total_leads, leads_info, result "
+            "FROM report_rows WHERE day >= ? ORDER BY run_id != 'import', run_id, plan_index, id",
+            (since,)
+        )
+        return [[datetime.fromisoformat(recorded_at).strftime(REPORT_TIME_FORMAT), url, sheet, sequence, email,
+                 leads_info if total_leads is None else total_leads, result]
+                for recorded_at, url, sheet, sequence, email, total_leads, leads_info, result in rows]
+
+    def daily_summary(self, days=30):
+        """
+        Итоги по дням
+        :return: список словарей day, leads и число строк каждого исхода (STATUSES)
+        """
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._query(
+            "SELECT day, status, COUNT(*), SUM(CASE WHEN status = 'success' THEN total_leads ELSE 0 END) "
+            "FROM report_rows WHERE day >= ? GROUP BY day, status ORDER BY day",
+            (since,)
+        )
+        summary = {}
+        for day, status, count, leads in rows:
+            item = summary.setdefault(day, dict({'day': day, 'leads': 0}, **dict.fromkeys(STATUSES, 0)))
+            item[status] = count
+            item['leads'] += leads or 0
+        return list(summary.values())
+
+    def group_summary(self, column, days=30):
+        """
+        Итоги по ящикам, цепочкам или листам
+        :param column: одно из SUMMARY_COLUMNS
+        :return: список словарей key, число строк каждого исхода, leads, last_error (по убыванию ошибок)
+        """
+        if column not in SUMMARY_COLUMNS:
+            raise ValueError(f"Итоги возможны по {', '.join(SUMMARY_COLUMNS)}, а не по {column}")
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._query(
+            f"SELECT {column}, "
+            + ', '.join(f"SUM(status = '{status}')" for status in STATUSES)
+            + ", SUM(CASE WHEN status = 'success' THEN total_leads ELSE 0 END), "
+            "MAX(CASE WHEN status = 'error' THEN day END) "
+            f"FROM report_rows WHERE day >= ? GROUP BY {column} ORDER BY SUM(status = 'error') DESC, {column}",
+            (since,)
+        )
+        return [dict(zip(('key', *STATUSES, 'leads', 'last_error'), row)) for row in rows]
+
+    def error_summary(self, days=30):
+        """
+        Ошибки ящиков по типу
+        :return: список словарей error, count, accounts, first_day, last_day
+        """
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._query(
+            "SELECT error, COUNT(*), COUNT(DISTINCT email), MIN(day), MAX(day) "
+            "FROM account_errors WHERE day >= ? GROUP BY error ORDER BY COUNT(*) DESC",
+            (since,)
+        )
+        return [dict(zip(('error', 'count', 'accounts', 'first_day', 'last_day'), row)) for row in rows]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def format_table(items):
+    """Таблица из списка словарей для вывода в консоль"""
+    if not items:
+        return "Нет данных"
+    columns = list(items[0])
+    cells = [[('' if item[column] is None else str(item[column])) for column in columns] for item in items]
+    widths = [max(len(column), *(len(row[i]) for row in cells)) for i, column in enumerate(columns)]
+    lines = ['  '.join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines += ['  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in cells]
+    return '\n'.join(line.rstrip() for line in lines)
+
+
+def main(argv=None):
+    from tenants import load_tenants
+
+    parser = argparse.ArgumentParser(description="История запусков энроллинга")
+    parser.add_argument('--tenant', help="арендатор (по умолчанию первый из Config.TENANTS)")
+    parser.add_argument('--db', help="путь к базе истории (вместо базы арендатора)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('daily', "итоги по дням"), ('emails', "итоги по ящикам"),
+                            ('sequences', "итоги по цепочкам"), ('sheets', "итоги по листам"),
+                            ('errors', "ошибки ящиков по типу")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('--days', type=int, default=30, help="за сколько последних дней")
+    commands.add_parser('import', help="перенести в историю строки листа отчета из таблицы")
+    args = parser.parse_args(argv)
+
+    tenants = load_tenants()
+    tenant = next((t for t in tenants if t.name == args.tenant), None) if args.tenant else tenants[0]
+    if tenant is None:
+        parser.error(f"неизвестный арендатор: {args.tenant}")
+
+    history = RunHistory(args.db or tenant.history_db)
+    try:
+        if args.command == 'import':
+            if history.report_sheet_imported:
+                print("Лист отчета уже перенесен в историю")
+                return 0
+            from services import tenant_services
+            from functions import get_sheet_range
+            rows = get_sheet_range(tenant.report_spread, Config.REPORT_SHEET, 'A:G', services=tenant_services(tenant))
+            print(f"Перенесено строк: {history.import_report_rows(rows)}")
+        elif args.command == 'daily':
+            print(format_table(history.daily_summary(args.days)))
+        elif args.command == 'errors':
+            print(format_table(history.error_summary(args.days)))
+        else:
+            column = {'emails': 'email', 'sequences': 'sequence', 'sheets': 'sheet'}[args.command]
+            print(format_table(history.group_summary(column, args.days)))
+    finally:
+        history.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import threading
+from datetime import date, timedelta
+from config import Config
+from catalogs import normalize_email, normalize_name
+
+
+def journal_key(day, row, filter_hash):
+    """Ключ строки в журнале: (дата, лист, ящик, цепочка, хэш фильтра)"""
+    return '|'.join([day, row.sheet_name, normalize_email(row.email), normalize_name(row.seq_name), filter_hash])
+
+
+class RunJournal:
+    """
+    Журнал запусков энроллинга (JSONL, только дозапись, fsync после каждой записи).
+    Хранит исход каждой обработанной строки за день, чтобы после падения процесса
+    продолжить с места остановки, и служит источником строк для выгрузки отчета.
+    """
+
+    def __init__(self, directory=None, day=None):
+        self.directory = directory or Config.JOURNAL_DIR
+        self.day = day or date.today().isoformat()
+        self.path = os.path.join(self.directory, f"{self.day}.jsonl")
+        self.run_id = time.time()
+        self._lock = threading.Lock()
+        self._completed = set()
+        self._recorded = set()
+        self._pending = {}
+        self._next_id = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Недописанная строка при аварийном завершении
+                    continue
+                if entry['type'] == 'row':
+                    self._next_id = max(self._next_id, entry['id'] + 1)
+                    self._pending[entry['id']] = entry
+                    self._recorded.add(entry['key'])
+                    if not entry['is_error']:
+                        self._completed.add(entry['key'])
+                elif entry['type'] == 'flushed':
+                    for entry_id in entry['ids']:
+                        self._pending.pop(entry_id, None)
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def is_completed(self, key):
+        """Строка уже успешно обработана сегодня"""
+        with self._lock:
+            return key in self._completed
+
+    def is_recorded(self, key):
+        """Исход строки уже записан сегодня (с ошибкой или без)"""
+        with self._lock:
+            return key in self._recorded
+
+    def record(self, key, index, report_row, is_error):
+        """
+        Записывает исход строки
+        :param key: journal_key строки
+        :param index: позиция строки в плане (для порядка отчета)
+        :param report_row: строка отчета
+        :param is_error: признак ошибки; строки с ошибкой при возобновлении обрабатываются снова
+        :return: id записи
+        """
+        with self._lock:
+            entry = {
+                'type': 'row',
+                'id': self._next_id,
+                'run': self.run_id,
+                'index': index,
+                'key': key,
+                'is_error': is_error,
+                'report_row': report_row,
+            }
+            self._next_id += 1
+            self._append(entry)
+            self._pending[entry['id']] = entry
+            self._recorded.add(key)
+            if not is_error:
+                self._completed.add(key)
+            return entry['id']
+
+    def report_order(self, entry_id):
+        """
+        Ключ порядка строки в отчете: запуск, позиция в плане, id записи.
+        Строки без записи в журнале идут последними
+        """
+        with self._lock:
+            entry = self._pending.get(entry_id)
+        if entry is None:
+            return (float('inf'),)
+        return entry['run'], entry['index'], entry['id']
+
+    def pending_report_rows(self):
+        """
+        Строки отчета, еще не выгруженные в таблицу
+        :return: список пар (id записи, строка отчета) в порядке запусков и строк плана
+        """
+        with self._lock:
+            entries = sorted(self._pending.values(), key=lambda e: (e['run'], e['index'], e['id']))
+        return [(entry['id'], entry['report_row']) for entry in entries]
+
+    def mark_flushed(self, entry_ids):
+        """Отмечает строки как выгруженные в отчет"""
+        entry_ids = list(entry_ids)
+        if not entry_ids:
+            return
+        with self._lock:
+            self._append({'type': 'flushed', 'ids': entry_ids})
+            for entry_id in entry_ids:
+                self._pending.pop(entry_id, None)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def cleanup_journals(directory=None, retention_days=None):
+    """Удаляет журналы старше retention_days дней"""
+    directory = directory or Config.JOURNAL_DIR
+    retention_days = Config.JOURNAL_RETENTION_DAYS if retention_days is None else retention_days
+    if not os.path.isdir(directory):
+        return
+    border = (date.today() - timedelta(days=retention_days)).isoformat()
+    for name in os.listdir(directory):
+        if name.endswith('.jsonl') and name[:-len('.jsonl')] < border:
+            os.remove(os.path.join(directory, name))
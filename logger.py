@@ -1,40 +1,65 @@
 import os
+import atexit
 from loguru import logger
-from notifiers.logging import NotificationHandler
-from env_loader import SECRETS_PATH
+import env_loader
 from config import Config
 
-# Настройка Telegram логгера
-token = os.getenv("TG_TOKEN")
-chat_id_1 = os.getenv("CHAT_ID_1")
-chat_id_4 = os.getenv("CHAT_ID_4")
-
-if token:
-    params_chat_1 = {
-        "token": token,
-        "chat_id": chat_id_1,
-    }
-    tg_handler_1 = NotificationHandler("telegram", defaults=params_chat_1)
-    logger.add(tg_handler_1, level="DEBUG")
-
-    params_chat_4 = {
-        "token": token,
-        "chat_id": chat_id_4,
-    }
-    tg_handler_4 = NotificationHandler("telegram", defaults=params_chat_4)
-    logger.add(tg_handler_4, level="INFO")
-
-
-# Настройка файлового логгера
-if Config.LOG_TO_FILE:
-    logger.add(
-        Config.LOG_FILE,
-        level=Config.LOG_LEVEL,
-        rotation="1 day",  # Ротация каждый день
-        retention="7 days",  # Хранить 7 дней
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
-    )
+_configured = False
+_sinks = []
+
+
+def configure_logging():
+    """Подключает Telegram и файловый логгер (один раз, при старте приложения)"""
+    global _configured
+    if _configured:
+        return logger
+    _configured = True
+
+    try:
+        env_loader.setup_environment()
+    except FileNotFoundError:
+        # Переменные TG_* могут быть заданы в окружении напрямую
+        pass
+
+    # Настройка Telegram логгера
+    token = os.getenv("TG_TOKEN")
+    chat_id_1 = os.getenv("CHAT_ID_1")
+    chat_id_4 = os.getenv("CHAT_ID_4")
+
+    if token:
+        # Сообщения копятся в буфере и уходят дайджестами из фонового потока,
+        # поток, пишущий в лог, не ждет Telegram
+        from notifications import DigestSink, telegram_sender
+
+        tg_sink_1 = DigestSink(telegram_sender(token, chat_id_1), name="telegram-chat-1")
+        logger.add(tg_sink_1, level="DEBUG", format="{message}")
+        _sinks.append(tg_sink_1)
+
+        tg_sink_4 = DigestSink(telegram_sender(token, chat_id_4), name="telegram-chat-4")
+        logger.add(tg_sink_4, level="INFO", format="{message}")
+        _sinks.append(tg_sink_4)
+
+        atexit.register(shutdown_logging)
+
+    # Настройка файлового логгера
+    if Config.LOG_TO_FILE:
+        logger.add(
+            Config.LOG_FILE,
+            level=Config.LOG_LEVEL,
+            rotation="1 day",  # Ротация каждый день
+            retention="7 days",  # Хранить 7 дней
+            format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+        )
+
+    return logger
+
+
+def shutdown_logging(timeout=30):
+    """Отправляет накопленные уведомления и останавливает фоновые потоки (при завершении приложения)"""
+    while _sinks:
+        _sinks.pop().close(timeout)
+
 
 def setup_logger():
-    """Настройка логгера"""
+    """Возвращает логгер; обработчики подключает configure_logging()"""
     return logger
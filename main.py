@@ -1,24 +1,38 @@
+import signal
 import functions as f
-from scheduler import Scheduler
+from scheduler import create_schedulers, run_schedulers
+from tenants import load_tenants
 import color_prints as p
-from logger import setup_logger
+from logger import setup_logger, configure_logging, shutdown_logging
+from metrics import start_metrics_server
 
 logger = setup_logger()
 
 
+def _handle_sigterm(signum, frame):
+    """docker stop присылает SIGTERM: остановка как по Ctrl+C, чтобы выполнились finally и atexit"""
+    logger.info("⏹️ Получен SIGTERM, остановка планировщиков")
+    raise KeyboardInterrupt
+
+
 def main():
     """Основная функция"""
+    configure_logging()
+    signal.signal(signal.SIGTERM, _handle_sigterm)
     try:
         p.print_success("Инициализация скрипта энроллинга...")
+        start_metrics_server()
 
-        # Создаем и запускаем планировщик
-        scheduler = Scheduler(f)
+        # Создаем планировщики: по одному на арендатора (команду) из Config.TENANTS
+        schedulers = create_schedulers(f, load_tenants())
 
-        # Запуск планировщика
-        scheduler.start_scheduler()
+        # Запуск планировщиков
+        run_schedulers(schedulers)
 
     except Exception as e:
         logger.error(f"🔴 Enroll_CN_enrolling.py Критическая ошибка при запуске: {str(e)}")
+    finally:
+        shutdown_logging()
 
 
 if __name__ == '__main__':
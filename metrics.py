@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import Config
+import color_prints as p
+from logger import setup_logger
+
+logger = setup_logger()
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+ID_SEGMENT_RE = re.compile(r'^[a-z]+_[A-Za-z0-9]{16,}$')
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'value': value} for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Гистограмма значений (обычно длительностей в секундах) с метками"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            return [{'labels': dict(key), 'count': series['count'], 'sum': round(series['sum'], 6)}
+                    for key, series in sorted(self._series.items())]
+
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text=''):
+        return self._get_or_create(Counter, name, help_text)
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Обнуляет значения всех метрик (например, между прогонами бенчмарка)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def snapshot(self):
+        """Метрики в виде словаря для JSON-сводки"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+registry = MetricsRegistry()
+
+PHASE_SECONDS = registry.histogram('enroll_phase_seconds', 'Длительность фаз энроллинга')
+API_REQUEST_SECONDS = registry.histogram('close_api_request_seconds', 'Длительность запросов к Close API')
+API_RESPONSES = registry.counter('close_api_responses_total', 'Ответы Close API по статусу')
+API_RETRIES = registry.counter('close_api_retries_total', 'Повторы запросов к Close API')
+SUBSCRIPTIONS = registry.counter('enroll_subscriptions_total', 'Обработанные строки по исходу')
+SEARCH_CACHE = registry.counter('enroll_search_cache_total', 'Обращения к кэшу поиска')
+SHEET_CACHE = registry.counter('enroll_sheet_cache_total', 'Обращения к кэшу листов энроллинга')
+PACING_SECONDS = registry.counter('enroll_pacing_sleep_seconds_total', 'Время ожидания между подписками')
+REPORT_ROWS = registry.counter('enroll_report_rows_total', 'Выгруженные строки отчета')
+REPORT_FLUSH_SECONDS = registry.histogram('enroll_report_flush_seconds', 'Длительность выгрузки отчета')
+PREFETCH_SECONDS = registry.histogram('enroll_prefetch_seconds', 'Длительность загрузки источников перед обработкой')
+BREAKER_TRANSITIONS = registry.counter('enroll_breaker_transitions_total', 'Переключения размыкателей цепи')
+BULK_ACTIONS = registry.counter('close_bulk_actions_total', 'Завершенные bulk action подписок по статусу')
+BULK_LEADS = registry.counter('close_bulk_leads_total', 'Лиды в bulk action подписок по исходу')
+BULK_COMPLETION_SECONDS = registry.histogram('close_bulk_completion_seconds', 'Время выполнения bulk action подписок')
+
+
+def endpoint_label(endpoint):
+    """Эндпоинт без идентификаторов объектов, чтобы метки не размножались"""
+    segments = [s for s in endpoint.strip('/').split('/') if s]
+    return '/'.join(':id' if ID_SEGMENT_RE.match(s) else s for s in segments)
+
+
+@contextmanager
+def timed(histogram, **labels):
+    """Замеряет длительность блока и записывает ее в гистограмму"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+
+
+def timed_phase(tenant, phase):
+    """Замер фазы энроллинга арендатора"""
+    return timed(PHASE_SECONDS, tenant=tenant, phase=phase)
+
+
+def write_run_summary(path=None, **summary):
+    """Сохраняет JSON-сводку запуска: переданные поля и снимок всех метрик"""
+    path = path or Config.METRICS_SUMMARY_FILE
+    if not path:
+        return None
+    data = dict(summary, metrics=registry.snapshot())
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=None, host='0.0.0.0'):
+    """
+    Запускает HTTP эндпоинт /metrics в фоновом потоке.
+    Если порт занят, энроллинг работает без эндпоинта
+    :return: сервер или None
+    """
+    port = Config.METRICS_PORT if port is None else port
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        message = f"Эндпоинт /metrics не запущен (порт {port}): {str(e)}"
+        p.print_warning(message)
+        logger.warning(f"⚠️ {message}")
+        return None
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
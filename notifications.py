@@ -0,0 +1,151 @@
+import sys
+import threading
+from collections import Counter, OrderedDict
+from config import Config
+
+
+def telegram_sender(token, chat_id):
+    """
+    Функция отправки текста в Telegram через notifiers
+    :return: send(text), выбрасывает исключение при неудачной отправке
+    """
+    from notifiers import get_notifier
+    telegram = get_notifier('telegram')
+
+    def send(text):
+        telegram.notify(message=text, token=token, chat_id=chat_id, raise_on_errors=True)
+    return send
+
+
+class DigestSink:
+    """
+    Неблокирующий sink loguru: сообщения складываются в ограниченный буфер
+    и отправляются фоновым потоком дайджестами раз в interval секунд.
+    Ошибки (ERROR и выше) отправляются не позже чем через urgent_delay секунд.
+    Одинаковые сообщения схлопываются в одну строку со счетчиком. При переполнении буфера
+    вытесняются самые старые сообщения самого низкого уровня, в дайджест попадает число пропущенных.
+    """
+
+    URGENT_LEVEL = 40  # ERROR
+
+    def __init__(self, send, interval=None, urgent_delay=None, max_queue=None,
+                 message_limit=None, max_attempts=None, name="notifications"):
+        self.send = send
+        self.interval = interval or Config.NOTIFY_DIGEST_INTERVAL
+        self.urgent_delay = urgent_delay or Config.NOTIFY_URGENT_DELAY
+        self.max_queue = max_queue or Config.NOTIFY_QUEUE_MAX
+        self.message_limit = message_limit or Config.NOTIFY_MESSAGE_LIMIT
+        self.max_attempts = max_attempts or Config.NOTIFY_SEND_RETRIES
+        self.sent_count = 0
+        self.failed_count = 0
+        # (уровень, текст) -> [время первого, название уровня, количество]
+        self._entries = OrderedDict()
+        self._dropped = Counter()
+        self._urgent = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name=name)
+        self._thread.start()
+
+    def __call__(self, message):
+        """Вызывается loguru из потока, который пишет в лог; никогда не ждет сети"""
+        record = message.record
+        level = record['level']
+        self.add(level.no, level.name, record['message'], record['time'].strftime('%H:%M:%S'))
+
+    def add(self, level_no, level_name, text, time_str=''):
+        key = (level_no, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[2] += 1
+            elif len(self._entries) < self.max_queue or self._evict(level_no):
+                self._entries[key] = [time_str, level_name, 1]
+            else:
+                self._dropped[level_name] += 1
+                return
+            if level_no >= self.URGENT_LEVEL and not self._urgent:
+                self._urgent = True
+                self._wakeup.set()
+
+    def _evict(self, level_no):
+        """Вытесняет самое старое сообщение самого низкого уровня, если он ниже level_no"""
+        lowest = min(key[0] for key in self._entries)
+        if lowest >= level_no:
+            return False
+        for key, entry in self._entries.items():
+            if key[0] == lowest:
+                del self._entries[key]
+                self._dropped[entry[1]] += entry[2]
+                return True
+        return False
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Ждем интервал дайджеста; срочное сообщение сокращает ожидание до urgent_delay
+            if self._wakeup.wait(self.interval):
+                self._wakeup.clear()
+                if self._stop.wait(self.urgent_delay):
+                    break
+            self.flush()
+        self.flush()
+
+    def _take(self):
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+            dropped, self._dropped = self._dropped, Counter()
+            self._urgent = False
+        return entries, dropped
+
+    def format_digest(self, entries, dropped):
+        """Тексты сообщений дайджеста, каждый не длиннее message_limit символов"""
+        lines = []
+        for (_, text), (time_str, level_name, count) in entries.items():
+            suffix = f" (×{count})" if count > 1 else ''
+            lines.append(f"{time_str} {level_name}: {text}{suffix}".strip())
+        if dropped:
+            lines.append("Пропущено при переполнении: " +
+                         ', '.join(f"{level_name} {count}" for level_name, count in dropped.items()))
+
+        chunks, current = [], ''
+        for line in lines:
+            if len(line) > self.message_limit:
+                line = line[:self.message_limit - 1] + '…'
+            if current and len(current) + 1 + len(line) > self.message_limit:
+                chunks.append(current)
+                current = ''
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def flush(self):
+        """Отправляет накопленные сообщения; вызывается фоновым потоком и при остановке"""
+        entries, dropped = self._take()
+        if not entries and not dropped:
+            return True
+        ok = True
+        for text in self.format_digest(entries, dropped):
+            for attempt in range(self.max_attempts):
+                try:
+                    self.send(text)
+                    self.sent_count += 1
+                    break
+                except Exception as e:
+                    # Не через loguru, иначе ошибка отправки снова попадет в этот sink
+                    print(f"Ошибка отправки уведомления (попытка {attempt + 1}): {str(e)}", file=sys.stderr)
+                    if attempt < self.max_attempts - 1:
+                        # При остановке ожидание прерывается, оставшиеся попытки идут без пауз
+                        self._stop.wait(min(60, 2 ** attempt))
+            else:
+                self.failed_count += 1
+                ok = False
+        return ok
+
+    def close(self, timeout=None):
+        """Останавливает фоновый поток и отправляет остаток буфера"""
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
@@ -0,0 +1,71 @@
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+
+def _fetch_page(api, endpoint, params, skip, limit):
+    return api.get(endpoint, params=dict(params, _skip=skip, _limit=limit))
+
+
+def paginate(api, endpoint, params=None, limit=None, prefetch=True, workers=None):
+    """
+    Потоково отдает все элементы списка Close API (пагинация _skip/_limit до has_more=False).
+    Пока обрабатывается текущая страница, следующая запрашивается в фоне.
+    Если API вернул total_results, оставшиеся страницы запрашиваются параллельно.
+    :param api: клиент Close API с методом get(endpoint, params)
+    :param endpoint: эндпоинт списка, например 'sequence'
+    :param params: дополнительные параметры запроса
+    :param limit: размер страницы (_limit)
+    :param prefetch: запрашивать следующую страницу заранее
+    :param workers: число потоков для параллельной загрузки страниц
+    :return: генератор элементов
+    """
+    params = dict(params or {})
+    limit = limit or Config.PAGE_LIMIT
+    workers = workers or Config.PAGINATION_WORKERS
+
+    first = _fetch_page(api, endpoint, params, 0, limit)
+    data = first.get('data', [])
+    if not first.get('has_more') or not data:
+        yield from data
+        return
+
+    total = first.get('total_results')
+    executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="paginate")
+    try:
+        if total and workers > 1:
+            # Количество известно - все оставшиеся страницы запрашиваются сразу,
+            # отдаются по порядку по мере готовности
+            page_size = len(data)
+            futures = [(skip, executor.submit(_fetch_page, api, endpoint, params, skip, limit))
+                       for skip in range(page_size, total, page_size)]
+            yield from data
+            skip = page_size
+            last = first
+            for offset, future in futures:
+                page = future.result()
+                page_data = page.get('data', [])
+                yield from page_data
+                skip = offset + len(page_data)
+                last = page
+            if not last.get('has_more'):
+                return
+            # Список вырос, пока шла загрузка - дочитываем последовательно
+            data = []
+        else:
+            skip = len(data)
+
+        pending = executor.submit(_fetch_page, api, endpoint, params, skip, limit) if prefetch else None
+        while True:
+            yield from data
+            resp = pending.result() if pending else _fetch_page(api, endpoint, params, skip, limit)
+            data = resp.get('data', [])
+            skip += len(data)
+            has_more = resp.get('has_more') and data
+            pending = (executor.submit(_fetch_page, api, endpoint, params, skip, limit)
+                       if prefetch and has_more else None)
+            if not has_more:
+                yield from data
+                return
+    finally:
+        # Генератор могли закрыть досрочно - незапущенные запросы страниц отменяются
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,51 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def group_by_key(items, key):
+    """
+    Группирует элементы по ключу с сохранением исходного порядка
+    :param items: список элементов
+    :param key: функция, возвращающая ключ группы (например, email отправителя)
+    :return: OrderedDict ключ -> список пар (исходный индекс, элемент)
+    """
+    groups = OrderedDict()
+    for index, item in enumerate(items):
+        groups.setdefault(key(item), []).append((index, item))
+    return groups
+
+
+def run_paced_by_key(items, key, handler, delay, max_workers, sleep=time.sleep, paced=None):
+    """
+    Обрабатывает элементы в пуле потоков с паузой между элементами одной группы.
+    Группы (почтовые ящики) выполняются параллельно, внутри группы - строго по порядку
+    с паузой delay() после каждого элемента, кроме последнего.
+    :param items: список элементов
+    :param key: функция ключа группы
+    :param handler: функция обработки одного элемента, возвращает результат
+    :param delay: функция без аргументов, возвращающая паузу в секундах
+    :param max_workers: максимальное число одновременно обрабатываемых групп
+    :param sleep: функция ожидания, по умолчанию time.sleep
+    :param paced: функция результата; False - пауза после элемента не нужна (элемент пропущен)
+    :return: список результатов в исходном порядке элементов
+    """
+    results = [None] * len(items)
+    groups = group_by_key(items, key)
+
+    def run_group(group):
+        for position, (index, item) in enumerate(group):
+            results[index] = handler(item)
+            if position < len(group) - 1 and (paced is None or paced(results[index])):
+                sleep(delay())
+
+    if not groups:
+        return results
+
+    workers = max(1, min(max_workers, len(groups)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mailbox") as executor:
+        futures = [executor.submit(run_group, group) for group in groups.values()]
+        for future in futures:
+            future.result()
+
+    return results
@@ -0,0 +1,218 @@
+import json
+import hashlib
+from collections import Counter
+from dataclasses import dataclass
+from types import MappingProxyType
+from records import EnrollRow
+from catalogs import normalize_email, normalize_name
+
+REQUIRED_FILTER_KEYS = ('query', 'sort', 'results_limit')
+
+
+def filter_hash(filters):
+    """Хэш содержимого фильтра, не зависящий от порядка ключей и форматирования"""
+    canonical = json.dumps(filters, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class FilterCache:
+    """
+    Кэш проверенных фильтров по хэшу содержимого.
+    Одинаковые filters_json из разных листов и ящиков проверяются один раз
+    и разделяют один неизменяемый объект запроса.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, filters):
+        """
+        :param filters: распарсенный filters_json
+        :return: кортеж (хэш, неизменяемый запрос или None, текст ошибки или None)
+        """
+        key = filter_hash(filters)
+        if key not in self._cache:
+            missing = [k for k in REQUIRED_FILTER_KEYS if k not in filters]
+            if missing:
+                self._cache[key] = (None, f"в filters_json нет ключей: {', '.join(missing)}")
+            else:
+                self._cache[key] = (MappingProxyType(filters), None)
+        query, error = self._cache[key]
+        return key, query, error
+
+    def __len__(self):
+        return len(self._cache)
+
+
+@dataclass(frozen=True, slots=True)
+class PlannedSubscription:
+    """Проверенная подписка, готовая к выполнению"""
+    index: int
+    row: EnrollRow
+    filter_hash: str
+    query: MappingProxyType
+    sequence_id: str
+    account: MappingProxyType
+    sender_name: str = None
+
+
+@dataclass(frozen=True, slots=True)
+class RejectedRow:
+    """Строка, не прошедшая проверку до начала обработки"""
+    index: int
+    row: EnrollRow
+    reason: str
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """Неизменяемый план энроллинга: подписки к выполнению и отклоненные строки"""
+    items: tuple
+    rejected: tuple
+    unique_filters: int = 0
+
+    def __len__(self):
+        return len(self.items) + len(self.rejected)
+
+    def summary(self):
+        """Текстовая сводка плана (для dry-run и уведомлений)"""
+        lines = [
+            f"План энроллинга: {len(self.items)} подписок к выполнению, {len(self.rejected)} отклонено",
+            f"Уникальных фильтров: {self.unique_filters}",
+        ]
+        by_mailbox = Counter(item.account['email'] for item in self.items)
+        for email, count in sorted(by_mailbox.items()):
+            lines.append(f"  {email}: {count}")
+        if self.rejected:
+            lines.append("Причины отклонения:")
+            for reason, count in Counter(r.reason for r in self.rejected).most_common():
+                lines.append(f"  {reason}: {count}")
+        return '\n'.join(lines)
+
+
+@dataclass(frozen=True, slots=True)
+class DuplicateRow:
+    """Строка, совпавшая с уже загруженной (тот же ящик, цепочка и фильтр)"""
+    row: EnrollRow
+    kept: EnrollRow
+
+
+@dataclass(frozen=True)
+class DedupResult:
+    """Строки после удаления дублей, удаленные дубли и конфликты"""
+    rows: tuple
+    duplicates: tuple
+    conflicts: MappingProxyType  # (ящик, цепочка) -> строки с разными фильтрами
+
+    def summary(self):
+        """Текстовая сводка удаленных дублей и конфликтов"""
+        lines = [f"Дублей удалено: {len(self.duplicates)}, конфликтов: {len(self.conflicts)}"]
+        for duplicate in self.duplicates:
+            lines.append(f"  дубль {duplicate.row.sheet_name}: {duplicate.row.email} -> {duplicate.row.seq_name} "
+                         f"(оставлена строка листа {duplicate.kept.sheet_name})")
+        for (email, seq_name), rows in self.conflicts.items():
+            sheets = ', '.join(sorted({row.sheet_name for row in rows}))
+            lines.append(f"  конфликт {email} -> {seq_name}: разных фильтров {len(rows)} ({sheets})")
+        return '\n'.join(lines)
+
+
+def row_filter_key(row):
+    """Хэш фильтра строки: по содержимому, если filters_json разобран, иначе по исходному тексту"""
+    if row.filters is not None:
+        return filter_hash(row.filters)
+    return hashlib.sha1(row.filters_json.strip().encode('utf-8')).hexdigest()
+
+
+def dedupe_rows(rows):
+    """
+    Удаляет повторы строк (ящик, цепочка, фильтр) со всех листов и находит конфликты -
+    один ящик и цепочка с разными корректными фильтрами. Первая встреченная строка остается,
+    строки без filters_json не затрагиваются
+    :param rows: строки энроллинга (EnrollRow)
+    :return: DedupResult
+    """
+    kept_rows = []
+    duplicates = []
+    seen = {}  # (ящик, цепочка, хэш фильтра) -> оставленная строка
+    by_target = {}  # (ящик, цепочка) -> {хэш фильтра: строка}
+
+    for row in rows:
+        if not row.filters_json:
+            kept_rows.append(row)
+            continue
+        target = (normalize_email(row.email), normalize_name(row.seq_name))
+        key = target + (row_filter_key(row),)
+        kept = seen.get(key)
+        if kept is not None:
+            duplicates.append(DuplicateRow(row, kept))
+            continue
+        seen[key] = row
+        if not row.filters_error:
+            by_target.setdefault(target, {})[key[2]] = row
+        kept_rows.append(row)
+
+    conflicts = {}
+    for variants in by_target.values():
+        if len(variants) > 1:
+            first = next(iter(variants.values()))
+            conflicts[(first.email, first.seq_name)] = tuple(variants.values())
+    return DedupResult(rows=tuple(kept_rows), duplicates=tuple(duplicates), conflicts=MappingProxyType(conflicts))
+
+
+def find_sender_name(account, email):
+    """Имя отправителя из identities ящика для указанного email"""
+    for item in account.get('identities') or []:
+        if item.get('email', '').lower() == email.lower():
+            return item.get('name')
+    return None
+
+
+def build_plan(rows, seqID_dict, accounts, filter_cache=None):
+    """
+    Проверяет все строки до первого запроса на поиск/подписку
+    :param rows: строки энроллинга (EnrollRow), пустые filters_json пропускаются
+    :param seqID_dict: словарь название цепочки -> ID или None
+    :param accounts: индекс ящиков с методом get(email)
+    :param filter_cache: FilterCache, создается при необходимости
+    :return: ExecutionPlan
+    """
+    filter_cache = filter_cache if filter_cache is not None else FilterCache()
+    items = []
+    rejected = []
+
+    for index, row in enumerate(r for r in rows if r.filters_json):
+        if row.filters_error:
+            rejected.append(RejectedRow(index, row, row.filters_error))
+            continue
+
+        key, query, error = filter_cache.get(row.filters)
+        if error:
+            rejected.append(RejectedRow(index, row, error))
+            continue
+
+        account = accounts.get(row.email)
+        sequence_id = seqID_dict.get(row.seq_name)
+        if not account and not sequence_id:
+            reason = f"ящик {row.email} не найден, цепочка {row.seq_name} не найдена"
+        elif not account:
+            reason = f"ящик {row.email} не найден"
+        elif not sequence_id:
+            reason = f"цепочка {row.seq_name} не найдена"
+        else:
+            reason = None
+
+        if reason:
+            rejected.append(RejectedRow(index, row, reason))
+            continue
+
+        items.append(PlannedSubscription(
+            index=index,
+            row=row,
+            filter_hash=key,
+            query=query,
+            sequence_id=sequence_id,
+            account=MappingProxyType(account),
+            sender_name=find_sender_name(account, row.email),
+        ))
+
+    return ExecutionPlan(items=tuple(items), rejected=tuple(rejected), unique_filters=len(filter_cache))
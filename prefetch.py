@@ -0,0 +1,61 @@
+import time
+import asyncio
+from dataclasses import dataclass, field
+from metrics import PREFETCH_SECONDS
+
+
+@dataclass
+class WarmContext:
+    """Итог параллельной загрузки перед обработкой: результаты, длительности и ошибки по источникам"""
+    results: dict = field(default_factory=dict)
+    seconds: dict = field(default_factory=dict)
+    failures: dict = field(default_factory=dict)
+
+    def ok(self, source):
+        return source in self.results
+
+    def summary(self):
+        """Текстовая сводка загрузки"""
+        parts = [f"{source} {seconds:.1f} с" for source, seconds in self.seconds.items() if self.ok(source)]
+        lines = [f"Предзагрузка: {', '.join(parts) if parts else 'нет успешных источников'}"]
+        for source, error in self.failures.items():
+            lines.append(f"  {source}: {describe_error(error)}")
+        return '\n'.join(lines)
+
+
+def describe_error(error):
+    if isinstance(error, asyncio.TimeoutError):
+        return "превышено время ожидания"
+    return str(error) or type(error).__name__
+
+
+async def prefetch_sources(sources, timeouts=None, labels=None):
+    """
+    Запускает независимые загрузки одновременно и собирает их в WarmContext.
+    Ошибка или таймаут одного источника не прерывают остальные
+    :param sources: словарь источник -> функция без аргументов, возвращающая корутину
+    :param timeouts: словарь источник -> таймаут в секундах (None - без таймаута)
+    :param labels: дополнительные метки метрик (например, tenant)
+    :return: WarmContext
+    """
+    timeouts = timeouts or {}
+    labels = labels or {}
+
+    async def run(source):
+        started = time.perf_counter()
+        try:
+            return await asyncio.wait_for(sources[source](), timeouts.get(source))
+        finally:
+            seconds = time.perf_counter() - started
+            context.seconds[source] = seconds
+
+    context = WarmContext()
+    outcomes = await asyncio.gather(*(run(source) for source in sources), return_exceptions=True)
+    for source, outcome in zip(sources, outcomes):
+        if isinstance(outcome, BaseException):
+            context.failures[source] = outcome
+        else:
+            context.results[source] = outcome
+        PREFETCH_SECONDS.observe(context.seconds.get(source, 0.0), source=source,
+                                 outcome='ok' if context.ok(source) else 'error', **labels)
+    return context
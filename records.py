@@ -0,0 +1,67 @@
+import json
+from dataclasses import dataclass, fields, astuple
+
+ROW_COLUMNS = ('email', 'url', 'filters_json')
+
+
+@dataclass(frozen=True, slots=True)
+class EnrollRow:
+    """Строка листа энроллинга"""
+    email: str
+    url: str
+    filters_json: str
+    seq_name: str
+    sheet_name: str
+    filters: dict = None  # распарсенный filters_json
+    filters_error: str = None  # ошибка разбора filters_json
+
+
+def parse_filters(filters_json):
+    """
+    Разбирает filters_json строки
+    :return: кортеж (словарь фильтров или None, текст ошибки или None)
+    """
+    if not filters_json:
+        return None, None
+    try:
+        filters = json.loads(filters_json)
+    except ValueError as e:
+        return None, f"некорректный filters_json: {str(e)}"
+    if not isinstance(filters, dict):
+        return None, "некорректный filters_json: ожидается объект"
+    return filters, None
+
+
+def iter_sheet_rows(sheet_name, sheet_range):
+    """
+    Превращает значения листа в записи EnrollRow.
+    В A1 листа - название цепочки, данные начинаются с 4-й строки
+    :param sheet_name: название листа
+    :param sheet_range: значения диапазона A:C (список строк)
+    :return: генератор EnrollRow
+    """
+    seq_name = sheet_range[0][0] if sheet_range[0] else ''
+    width = len(ROW_COLUMNS)
+    for values in sheet_range[3:]:
+        values = (list(values[:width]) + [''] * width)[:width]
+        email, url, filters_json = values
+        filters, filters_error = parse_filters(filters_json)
+        yield EnrollRow(
+            email=email,
+            url=url,
+            filters_json=filters_json,
+            seq_name=seq_name,
+            sheet_name=sheet_name,
+            filters=filters,
+            filters_error=filters_error,
+        )
+
+
+def to_dataframe(rows):
+    """Собирает записи в pandas.DataFrame для ручного анализа (pandas - опциональная зависимость)"""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError("Для to_dataframe требуется pandas: pip install pandas")
+    columns = [field.name for field in fields(EnrollRow)]
+    return pd.DataFrame([astuple(row) for row in rows], columns=columns)
@@ -0,0 +1,112 @@
+import time
+import threading
+import color_prints as p
+from config import Config
+from transport import backoff_delay
+from metrics import REPORT_FLUSH_SECONDS, REPORT_ROWS, timed
+
+
+class ReportWriter:
+    """
+    Буферизованная выгрузка отчета в Google Sheets во время обработки.
+    Строки копятся в буфере и дописываются на лист (append_rows) фоновым потоком каждые flush_every строк
+    или flush_interval секунд, потоки обработки на выгрузке не ждут. Неудачная выгрузка повторяется; буфер ограничен max_buffer строками -
+    при переполнении самые старые строки вытесняются и остаются невыгруженными в журнале
+    до следующей выгрузки. Строки завершаются в параллельных ящиках в произвольном порядке,
+    поэтому каждая выгрузка упорядочивается по позиции строки в плане (из журнала).
+    """
+
+    def __init__(self, append_rows, journal=None, flush_every=None, flush_interval=None,
+                 max_buffer=None, max_attempts=None, sleep=time.sleep):
+        self.append_rows = append_rows
+        self.journal = journal
+        self.flush_every = flush_every or Config.REPORT_FLUSH_ROWS
+        self.flush_interval = flush_interval or Config.REPORT_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or Config.REPORT_BUFFER_MAX
+        self.max_attempts = max_attempts or Config.REPORT_FLUSH_RETRIES
+        self.sleep = sleep
+        self.flushed_count = 0
+        self.dropped_count = 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()  # буфер заполнен, выгрузка не ждет таймера
+        self._thread = None
+
+    def start(self):
+        """Запускает фоновую выгрузку по таймеру и заполнению буфера"""
+        self._thread = threading.Thread(target=self._run, daemon=True, name="report-writer")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            self.flush()
+
+    def add(self, entry_id, report_row):
+        """
+        Добавляет строку отчета в буфер
+        :param entry_id: id записи журнала (None, если журнал не используется)
+        :param report_row: строка отчета
+        :return: None
+        """
+        with self._lock:
+            self._buffer.append((entry_id, report_row))
+            overflow = len(self._buffer) - self.max_buffer
+            if overflow > 0:
+                del self._buffer[:overflow]
+                self.dropped_count += overflow
+            ready = len(self._buffer) >= self.flush_every
+        if ready:
+            if self._thread is None:
+                self.flush()
+            else:
+                self._wake.set()
+
+    def flush(self):
+        """Выгружает накопленные строки; при неудаче строки возвращаются в буфер"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return True
+            if self.journal is not None:
+                batch.sort(key=lambda entry: self.journal.report_order(entry[0]))
+
+            for attempt in range(self.max_attempts):
+                try:
+                    with timed(REPORT_FLUSH_SECONDS):
+                        self.append_rows([report_row for _, report_row in batch])
+                    break
+                except Exception as e:
+                    p.print_warning(f"Ошибка выгрузки отчета (попытка {attempt + 1}): {str(e)}")
+                    if attempt < self.max_attempts - 1:
+                        self.sleep(backoff_delay(attempt))
+            else:
+                with self._lock:
+                    self._buffer[:0] = batch
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self.dropped_count += overflow
+                return False
+
+            if self.journal is not None:
+                self.journal.mark_flushed(entry_id for entry_id, _ in batch if entry_id is not None)
+            self.flushed_count += len(batch)
+            REPORT_ROWS.inc(len(batch))
+            return True
+
+    def close(self):
+        """Останавливает таймер и выгружает остаток буфера"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush()
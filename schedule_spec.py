@@ -0,0 +1,100 @@
+from datetime import datetime, date, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+
+FIELD_RANGES = (
+    (0, 59),  # минуты
+    (0, 23),  # часы
+    (1, 31),  # день месяца
+    (1, 12),  # месяц
+    (0, 7),  # день недели (0 и 7 - воскресенье)
+)
+
+MAX_LOOKAHEAD_DAYS = 366 * 5
+
+
+def parse_field(field, low, high):
+    """
+    Разбирает поле cron: "*", "5", "1-5", "*/15", "1,3,5", "10-20/2"
+    :return: отсортированный кортеж значений
+    """
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(x) for x in part.split('-'))
+        else:
+            start = end = int(part)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Некорректное поле расписания: {field}")
+        values.update(range(start, end + 1, step))
+    return tuple(sorted(values))
+
+
+class CronSpec:
+    """
+    Расписание в формате cron ("минуты часы день_месяца месяц день_недели")
+    с часовым поясом и календарем праздников.
+    """
+
+    def __init__(self, expression, timezone=None, holidays=()):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Ожидается 5 полей cron, получено: {expression}")
+        self.expression = expression
+        self.tz = ZoneInfo(timezone) if timezone else None
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            parse_field(field, low, high) for field, (low, high) in zip(fields, FIELD_RANGES)
+        )
+        # cron: 0 - воскресенье; datetime.weekday(): 0 - понедельник
+        self.weekdays = frozenset((d - 1) % 7 for d in weekdays)
+        self._any_day = fields[2] == '*'
+        self._any_weekday = fields[4] == '*'
+        self.holidays = frozenset(h if isinstance(h, date) else date.fromisoformat(h) for h in holidays)
+
+    def now(self):
+        return datetime.now(self.tz)
+
+    def matches_day(self, day):
+        """Подходит ли дата по месяцу, дню месяца/недели и календарю праздников"""
+        if day in self.holidays or day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = day.weekday() in self.weekdays
+        # Как в cron: если ограничены оба поля, достаточно совпадения одного из них
+        if self._any_day:
+            return weekday_ok
+        if self._any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def fire_times(self, day):
+        """Все моменты запуска в указанный день (с учетом часового пояса)"""
+        if not self.matches_day(day):
+            return []
+        return [datetime.combine(day, dt_time(hour, minute), tzinfo=self.tz)
+                for hour in self.hours for minute in self.minutes]
+
+    def next_after(self, moment):
+        """Ближайший момент запуска строго после moment"""
+        moment = moment.astimezone(self.tz) if self.tz and moment.tzinfo else moment
+        day = moment.date()
+        for _ in range(MAX_LOOKAHEAD_DAYS):
+            for fire_time in self.fire_times(day):
+                if fire_time > moment:
+                    return fire_time
+            day += timedelta(days=1)
+        raise ValueError(f"Расписание {self.expression} не срабатывает в ближайшие годы")
+
+    def last_fire_today(self, moment):
+        """Последний момент запуска сегодня, не позже moment, или None"""
+        moment = moment.astimezone(self.tz) if self.tz and moment.tzinfo else moment
+        past = [fire_time for fire_time in self.fire_times(moment.date()) if fire_time <= moment]
+        return past[-1] if past else None
+
+    def __str__(self):
+        return self.expression
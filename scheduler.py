@@ -1,8 +1,9 @@
-import time
+import os
+import json
 import threading
-from datetime import datetime, time as dt_time
 from config import Config
 from enroll_processor import EnrollProcessor
+from tenants import DEFAULT_TENANT
 import color_prints as p
 from logger import setup_logger
 
@@ -10,51 +11,71 @@ logger = setup_logger()
 
 
 class Scheduler:
-    def __init__(self, functions_module):
-        self.processor = EnrollProcessor(functions_module)
+    def __init__(self, functions_module, tenant=None):
+        self.processor = EnrollProcessor(functions_module, tenant)
         self.functions = functions_module
+        self.tenant = self.processor.tenant
+        self.schedule = self.processor.schedule
         self.is_running = True
+        self._stop_event = threading.Event()
+        self.processor.last_run_date = self._load_last_run_date()
 
-    def should_run_now(self):
-        """Проверяем, нужно ли запускать сейчас"""
-        now = datetime.now()
-
-        # Проверяем день недели
-        if now.weekday() not in Config.WORKING_DAYS:
-            return False
-
-        # Проверяем время
-        current_time = now.time()
-        target_time = Config.SCHEDULE_TIME
-
-        # Запускаем в течение 1 минуты после целевого времени
-        time_diff = abs((current_time.hour * 60 + current_time.minute) -
-                        (target_time.hour * 60 + target_time.minute))
-        return time_diff <= 1
+    def _load_last_run_date(self):
+        """Читает дату последнего успешного запуска (переживает перезапуск контейнера)"""
+        try:
+            with open(self.tenant.state_file, encoding='utf-8') as f:
+                return json.load(f).get('last_run_date')
+        except (OSError, ValueError):
+            return None
+
+    def _save_last_run_date(self):
+        if not self.processor.last_run_date:
+            return
+        os.makedirs(os.path.dirname(self.tenant.state_file) or '.', exist_ok=True)
+        tmp_path = self.tenant.state_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'last_run_date': self.processor.last_run_date}, f)
+        os.replace(tmp_path, self.tenant.state_file)
+
+    def next_run_time(self, now=None):
+        """Ближайший момент запуска по расписанию"""
+        return self.schedule.next_after(now or self.schedule.now())
+
+    def missed_run_today(self, now=None):
+        """Сегодняшний запуск пропущен (процесс был остановлен в момент запуска)"""
+        now = now or self.schedule.now()
+        return (self.schedule.last_fire_today(now) is not None and
+                self.processor.last_run_date != now.date().isoformat())
 
     def run_scheduled(self):
-        """Запуск по расписанию"""
+        """Запуск по расписанию с ограниченным числом перезапусков при критической ошибке"""
         p.print_info("🕐 Запуск по расписанию...")
-        success, message = self.processor.process_enrollment()
+        attempts = 1 + (Config.MAX_RESTARTS if Config.RESTART_ON_CRITICAL_ERROR else 0)
+
+        for attempt in range(attempts):
+            try:
+                success, message = self.processor.process_enrollment()
+            except Exception as e:
+                success, message = False, str(e)
+            self._save_last_run_date()
+
+            if success:
+                return True
 
-        if not success:
             p.print_error(f"Скрипт завершился с критической ошибкой: {message}")
-            if Config.RESTART_ON_CRITICAL_ERROR:
-                p.print_info("Пытаемся перезапустить...")
-                self._restart_on_error()
-            else:
-                p.print_info("Ожидаем следующего рабочего дня для повторного запуска")
-
-    def _restart_on_error(self):
-        """Перезапуск при критической ошибке"""
-        try:
-            # Ждем 5 минут перед перезапуском
-            time.sleep(300)
+            if attempt == attempts - 1:
+                break
+            p.print_info(f"Пытаемся перезапустить через {Config.RESTART_DELAY} с "
+                         f"(попытка {attempt + 2} из {attempts})...")
+            if self._stop_event.wait(Config.RESTART_DELAY):
+                return False
             p.print_info("🔄 Перезапуск после критической ошибки...")
-            self.run_scheduled()
-        except Exception as e:
-            p.print_error(f"Ошибка при перезапуске: {str(e)}")
-            logger.error(f"🔴 Ошибка при перезапуске: {str(e)}")
+
+        if Config.RESTART_ON_CRITICAL_ERROR:
+            logger.error(f"{self.processor.log_prefix}🔴 Перезапуски исчерпаны ({Config.MAX_RESTARTS}), ожидаем следующего запуска по расписанию")
+        else:
+            p.print_info("Ожидаем следующего рабочего дня для повторного запуска")
+        return False
 
     def run_once(self):
         """Ручной запуск"""
@@ -62,6 +83,7 @@ class Scheduler:
         logger.info("▶️ Ручной запуск скрипта энроллинга")
 
         success, message = self.processor.process_enrollment()
+        self._save_last_run_date()
 
         if success:
             p.print_success(f"Скрипт завершил работу: {message}")
@@ -71,47 +93,82 @@ class Scheduler:
         return success
 
     def check_schedule(self):
-        """Проверяет расписание и запускает задачи"""
-        last_run_day = None
+        """Спит до ближайшего момента запуска и запускает задачу"""
+        if Config.CATCH_UP_MISSED and self.missed_run_today():
+            p.print_info("🕐 Сегодняшний запуск был пропущен, запускаем сейчас")
+            self.run_scheduled()
 
         while self.is_running:
             try:
-                now = datetime.now()
-                today_str = now.strftime("%Y-%m-%d")
+                now = self.schedule.now()
+                next_run = self.next_run_time(now)
+                p.print_info(f"Следующий запуск: {next_run:%Y-%m-%d %H:%M %Z}")
 
-                # Проверяем, нужно ли запускать сейчас
-                if (self.should_run_now() and
-                        last_run_day != today_str and
-                        now.weekday() in Config.WORKING_DAYS):
-                    p.print_info(f"🕐 Обнаружено время запуска: {Config.SCHEDULE_TIME}")
-                    self.run_scheduled()
-                    last_run_day = today_str
+                # Ожидание прерывается вызовом stop()
+                if self._stop_event.wait((next_run - now).total_seconds()):
+                    break
 
-                time.sleep(30)  # Проверяем каждые 30 секунд
+                p.print_info(f"🕐 Обнаружено время запуска: {next_run:%H:%M}")
+                self.run_scheduled()
 
             except Exception as e:
                 p.print_error(f"Ошибка в планировщике: {str(e)}")
-                logger.error(f"🔴 Ошибка в планировщике: {str(e)}")
-                time.sleep(60)
+                logger.error(f"{self.processor.log_prefix}🔴 Ошибка в планировщике: {str(e)}")
+                if self._stop_event.wait(60):
+                    break
+
+    def start_thread(self):
+        """Запускает проверку расписания в отдельном потоке"""
+        prefix = self.processor.log_prefix
+        p.print_success(f"{prefix}Скрипт энроллинга запущен. Расписание: {self.schedule} ({self.tenant.timezone})")
+        logger.info(f"{prefix}🟢 Скрипт энроллинга запущен. Расписание: {self.schedule} ({self.tenant.timezone})")
+
+        scheduler_thread = threading.Thread(target=self.check_schedule, daemon=True,
+                                            name=f"scheduler-{self.tenant.name}")
+        scheduler_thread.start()
+        return scheduler_thread
 
     def start_scheduler(self):
         """Запуск планировщика в отдельном потоке"""
-        p.print_success(f"Скрипт энроллинга запущен. Ожидание {Config.SCHEDULE_TIME} в рабочие дни...")
-        logger.info(f"🟢 Скрипт энроллинга запущен. Расписание: {Config.SCHEDULE_TIME} Пн-Пт")
-
-        # Запускаем проверку расписания в отдельном потоке
-        scheduler_thread = threading.Thread(target=self.check_schedule, daemon=True)
-        scheduler_thread.start()
-
-        try:
-            # Главный поток ждет завершения (или Ctrl+C)
-            while True:
-                time.sleep(1)
-        except KeyboardInterrupt:
-            p.print_info("Скрипт остановлен пользователем")
-            logger.info("⏹️ Скрипт энроллинга остановлен пользователем")
-            self.is_running = False
+        run_schedulers([self])
 
     def stop(self):
         """Остановка планировщика"""
         self.is_running = False
+        self._stop_event.set()
+
+
+def run_schedulers(schedulers):
+    """
+    Запускает планировщики (по одному на арендатора) и ждет их завершения или Ctrl+C.
+    Каждый арендатор работает в своем потоке со своим пулом ящиков, клиентом Close и журналом
+    :param schedulers: список Scheduler
+    :return: None
+    """
+    threads = [scheduler.start_thread() for scheduler in schedulers]
+    try:
+        # Главный поток ждет завершения (или Ctrl+C)
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
+    except KeyboardInterrupt:
+        p.print_info("Скрипт остановлен пользователем")
+        logger.info("⏹️ Скрипт энроллинга остановлен пользователем")
+        for scheduler in schedulers:
+            scheduler.stop()
+
+
+def create_schedulers(functions_module, tenants):
+    """
+    Планировщики арендаторов; у каждого арендатора кроме основного свой контейнер клиентов
+    :param functions_module: модуль functions
+    :param tenants: список Tenant
+    :return: список Scheduler
+    """
+    from services import tenant_services
+    schedulers = []
+    for tenant in tenants:
+        module = (functions_module if tenant.name == DEFAULT_TENANT
+                  else functions_module.bind(tenant_services(tenant)))
+        schedulers.append(Scheduler(module, tenant))
+    return schedulers
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date
+from config import Config
+from planner import filter_hash
+from metrics import SEARCH_CACHE
+
+
+class SearchCache:
+    """
+    Кэш результатов data/search/ по хэшу нормализованного запроса.
+    В памяти - LRU на max_size записей с TTL; при заданном db_path записи дублируются в SQLite,
+    чтобы повторный или перезапущенный в тот же день запуск не обращался к поиску снова.
+    Записи действительны только в день их получения.
+    """
+
+    def __init__(self, ttl=None, max_size=None, db_path=None, clock=time.time):
+        self.ttl = Config.SEARCH_CACHE_TTL if ttl is None else ttl
+        self.max_size = Config.SEARCH_CACHE_SIZE if max_size is None else max_size
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}  # ключ -> Event запроса, выполняющегося в другом потоке
+        self.hits = 0
+        self.misses = 0
+
+        db_path = Config.SEARCH_CACHE_DB if db_path is None else db_path
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "day TEXT NOT NULL, query_hash TEXT NOT NULL, stored_at REAL NOT NULL, response TEXT NOT NULL, "
+                "PRIMARY KEY (day, query_hash))"
+            )
+            self._db.execute("DELETE FROM search_cache WHERE day < ?", (date.today().isoformat(),))
+            self._db.commit()
+
+    def _is_fresh(self, day, stored_at):
+        return day == date.today().isoformat() and self.clock() - stored_at < self.ttl
+
+    def get(self, key):
+        """Возвращает сохраненный ответ или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                day, stored_at, response = entry
+                if self._is_fresh(day, stored_at):
+                    self._entries.move_to_end(key)
+                    return response
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT day, stored_at, response FROM search_cache WHERE day = ? AND query_hash = ?",
+                    (date.today().isoformat(), key)
+                ).fetchone()
+                if row and self._is_fresh(row[0], row[1]):
+                    response = json.loads(row[2])
+                    self._remember(key, (row[0], row[1], response))
+                    return response
+        return None
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def set(self, key, response):
+        """Сохраняет ответ поиска"""
+        entry = (date.today().isoformat(), self.clock(), response)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (day, query_hash, stored_at, response) VALUES (?, ?, ?, ?)",
+                    (entry[0], key, entry[1], json.dumps(response, ensure_ascii=False))
+                )
+                self._db.commit()
+
+    def get_or_fetch(self, query, fetch):
+        """
+        Возвращает ответ из кэша или выполняет fetch(query) и сохраняет результат.
+        Одинаковые запросы из разных потоков выполняются один раз: остальные ждут первый
+        :param query: запрос поиска (словарь)
+        :param fetch: функция, выполняющая поиск
+        :return: ответ поиска
+        """
+        key = filter_hash(dict(query))
+        while True:
+            response = self.get(key)
+            with self._lock:
+                if response is not None:
+                    self.hits += 1
+                    break
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Тот же запрос уже выполняется в другом потоке; при его ошибке попробуем сами
+            pending.wait()
+
+        SEARCH_CACHE.inc(result='hit' if response is not None else 'miss')
+        if response is not None:
+            return response
+        try:
+            response = fetch(query)
+            self.set(key, response)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+        return response
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
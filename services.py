@@ -0,0 +1,113 @@
+import os
+import threading
+import env_loader
+from config import Config
+from tenants import DEFAULT_TENANT
+
+
+class ServiceContainer:
+    """
+    Контейнер внешних клиентов (Google Sheets, Close API).
+    Каждый клиент создается при первом обращении и кэшируется; готовые или фейковые
+    клиенты можно передать в конструктор, тогда секреты и сеть не используются.
+    """
+
+    def __init__(self, gc=None, api=None, async_api_factory=None, api_key_env=None,
+                 rate_limit_rps=None, rate_limit_burst=None):
+        self._gc = gc
+        self._api = api
+        self._async_api_factory = async_api_factory
+        self.api_key_env = api_key_env or Config.CLOSE_API_KEY_ENV
+        self.rate_limit_rps = rate_limit_rps or Config.RATE_LIMIT_RPS
+        self.rate_limit_burst = rate_limit_burst or Config.RATE_LIMIT_BURST
+        self.spreadsheets = {}
+        self._lock = threading.Lock()
+
+    @property
+    def gc(self):
+        """Клиент gspread, авторизуется сервисным аккаунтом при первом обращении"""
+        if self._gc is None:
+            with self._lock:
+                if self._gc is None:
+                    import gspread
+                    service_account_file = os.path.join(env_loader.setup_environment(), 'service_account.json')
+                    self._gc = gspread.service_account(filename=service_account_file)
+        return self._gc
+
+    @property
+    def api_key(self):
+        """Ключ Close API из переменных окружения"""
+        env_loader.setup_environment()
+        return os.getenv(self.api_key_env)
+
+    @property
+    def api(self):
+        """Клиент Close API с ограничением скорости"""
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    from transport import RateLimitedClient, TokenBucket
+                    bucket = TokenBucket(self.rate_limit_rps, self.rate_limit_burst)
+                    self._api = RateLimitedClient(self.api_key, bucket=bucket)
+        return self._api
+
+    def async_api(self):
+        """
+        Новый асинхронный клиент Close API (открывается через async with).
+        Делит token bucket с синхронным клиентом, чтобы оба укладывались в одну квоту
+        """
+        if self._async_api_factory is not None:
+            return self._async_api_factory()
+        from async_client import AsyncCloseClient
+        return AsyncCloseClient(self.api_key, bucket=self.api.bucket)
+
+
+class LazyService:
+    """
+    Прокси, обращающийся к клиенту только в момент использования.
+    Без container - к клиенту текущего глобального контейнера
+    """
+
+    def __init__(self, name, container=None):
+        self._name = name
+        self._container = container
+
+    def __getattr__(self, attr):
+        container = self._container if self._container is not None else get_services()
+        return getattr(getattr(container, self._name), attr)
+
+    def __repr__(self):
+        return f"<LazyService {self._name}>"
+
+
+_services = ServiceContainer()
+_tenant_services = {}
+
+
+def get_services():
+    """Текущий контейнер клиентов"""
+    return _services
+
+
+def tenant_services(tenant):
+    """
+    Контейнер клиентов арендатора: свой ключ Close и свой token bucket.
+    Арендатор по умолчанию использует глобальный контейнер
+    """
+    if tenant.name == DEFAULT_TENANT:
+        return get_services()
+    container = _tenant_services.get(tenant.name)
+    if container is None:
+        container = _tenant_services[tenant.name] = ServiceContainer(
+            api_key_env=tenant.api_key_env,
+            rate_limit_rps=tenant.rate_limit_rps,
+            rate_limit_burst=tenant.rate_limit_burst,
+        )
+    return container
+
+
+def set_services(container):
+    """Подменяет контейнер клиентов (например, фейковыми клиентами) и возвращает предыдущий"""
+    global _services
+    previous, _services = _services, container
+    return previous
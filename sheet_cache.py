@@ -0,0 +1,105 @@
+import os
+import json
+import sqlite3
+import threading
+from records import iter_sheet_rows
+from metrics import SHEET_CACHE
+
+
+def parse_sheet(title, values):
+    """Строки EnrollRow из значений листа; пустой лист - пустой список"""
+    return list(iter_sheet_rows(title, values)) if values else []
+
+
+class SheetCache:
+    """
+    Кэш значений листов энроллинга по (id таблицы, id листа) с отметкой modifiedTime файла из Drive.
+    Пока modifiedTime таблицы не изменился, листы берутся из кэша без чтения через Sheets API.
+    Drive хранит время изменения только для всего файла, поэтому любое изменение таблицы
+    приводит к повторной загрузке всех листов одним batchGet; кэш используется, только если
+    отчеты пишутся в отдельную таблицу (Config.REPORT_SPREAD_NAME).
+    Разобранные строки (EnrollRow) хранятся в памяти, в SQLite - только значения листов.
+    """
+
+    def __init__(self, db_path=None):
+        self._rows = {}  # (id таблицы, id листа) -> (modifiedTime, название, список EnrollRow)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sheet_cache ("
+                "spreadsheet_id TEXT NOT NULL, sheet_id INTEGER NOT NULL, title TEXT NOT NULL, "
+                "modified_time TEXT NOT NULL, sheet_values TEXT NOT NULL, "
+                "PRIMARY KEY (spreadsheet_id, sheet_id))"
+            )
+            self._db.commit()
+
+    def get(self, spreadsheet_id, modified_time):
+        """
+        Листы таблицы, если они сохранены при том же modifiedTime
+        :return: словарь название листа -> список EnrollRow или None
+        """
+        with self._lock:
+            entries = {sheet_id: entry for (cached_id, sheet_id), entry in self._rows.items()
+                       if cached_id == spreadsheet_id}
+            if entries and all(entry[0] == modified_time for entry in entries.values()):
+                self.hits += 1
+                SHEET_CACHE.inc(result='hit')
+                return {title: rows for _, title, rows in entries.values()}
+
+            if self._db is not None:
+                stored = self._db.execute(
+                    "SELECT sheet_id, title, modified_time, sheet_values FROM sheet_cache "
+                    "WHERE spreadsheet_id = ? ORDER BY rowid",
+                    (spreadsheet_id,)
+                ).fetchall()
+                if stored and all(row[2] == modified_time for row in stored):
+                    sheets = {}
+                    for sheet_id, title, _, sheet_values in stored:
+                        rows = parse_sheet(title, json.loads(sheet_values))
+                        self._rows[(spreadsheet_id, sheet_id)] = (modified_time, title, rows)
+                        sheets[title] = rows
+                    self.hits += 1
+                    SHEET_CACHE.inc(result='hit')
+                    return sheets
+
+            self.misses += 1
+        SHEET_CACHE.inc(result='miss')
+        return None
+
+    def store(self, spreadsheet_id, modified_time, sheets):
+        """
+        Заменяет сохраненные листы таблицы
+        :param sheets: список кортежей (id листа, название, значения диапазона)
+        :return: словарь название листа -> список EnrollRow
+        """
+        parsed = {}
+        with self._lock:
+            for key in [key for key in self._rows if key[0] == spreadsheet_id]:
+                del self._rows[key]
+            for sheet_id, title, values in sheets:
+                rows = parse_sheet(title, values)
+                self._rows[(spreadsheet_id, sheet_id)] = (modified_time, title, rows)
+                parsed[title] = rows
+
+            if self._db is not None:
+                # Удаленные из таблицы листы удаляются и из кэша
+                self._db.execute("DELETE FROM sheet_cache WHERE spreadsheet_id = ?", (spreadsheet_id,))
+                self._db.executemany(
+                    "INSERT INTO sheet_cache (spreadsheet_id, sheet_id, title, modified_time, sheet_values) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(spreadsheet_id, sheet_id, title, modified_time, json.dumps(values or [], ensure_ascii=False))
+                     for sheet_id, title, values in sheets]
+                )
+                self._db.commit()
+        return parsed
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,122 @@
+import os
+from dataclasses import dataclass, fields
+from config import Config
+
+DEFAULT_TENANT = 'default'
+
+
+@dataclass(frozen=True)
+class Tenant:
+    """
+    Команда со своей таблицей энроллинга, ключом Close и расписанием.
+    Журнал, кэш поиска и состояние планировщика у каждого арендатора свои
+    """
+    name: str
+    spread_name: str
+    sheet_prefix: str
+    api_key_env: str
+    schedule_cron: str
+    timezone: str
+    holidays: tuple = ()
+    report_spread_name: str = None
+    rate_limit_rps: float = None
+    rate_limit_burst: float = None
+    max_mailbox_workers: int = None
+    journal_dir: str = None
+    search_cache_db: str = None
+    sheet_cache_db: str = None
+    history_db: str = None
+    state_file: str = None
+
+    @property
+    def report_spread(self):
+        """Таблица листов отчета, ошибок и итогов"""
+        return self.report_spread_name or self.spread_name
+
+
+def _suffixed(path, name):
+    """Путь файла арендатора: scheduler_state.json -> scheduler_state_<name>.json"""
+    if not path:
+        return path
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{name}{ext}"
+
+
+def tenant_path(path, tenant):
+    """Путь общего файла для арендатора; у арендатора по умолчанию путь не меняется"""
+    return path if tenant.name == DEFAULT_TENANT else _suffixed(path, tenant.name)
+
+
+def default_tenant():
+    """Единственный арендатор из основных настроек Config (режим одной команды)"""
+    return Tenant(
+        name=DEFAULT_TENANT,
+        spread_name=Config.SPREAD_NAME,
+        sheet_prefix=Config.SHEET_PREFIX,
+        api_key_env=Config.CLOSE_API_KEY_ENV,
+        schedule_cron=Config.SCHEDULE_CRON,
+        timezone=Config.TIMEZONE,
+        holidays=tuple(Config.HOLIDAYS),
+        report_spread_name=Config.REPORT_SPREAD_NAME,
+        rate_limit_rps=Config.RATE_LIMIT_RPS,
+        rate_limit_burst=Config.RATE_LIMIT_BURST,
+        max_mailbox_workers=Config.MAX_MAILBOX_WORKERS,
+        journal_dir=Config.JOURNAL_DIR,
+        search_cache_db=Config.SEARCH_CACHE_DB,
+        sheet_cache_db=Config.SHEET_CACHE_DB,
+        history_db=Config.HISTORY_DB,
+        state_file=Config.SCHEDULER_STATE_FILE,
+    )
+
+
+def tenant_from_dict(data):
+    """
+    Арендатор из записи Config.TENANTS; незаданные параметры берутся из Config
+    :param data: словарь с обязательными name, spread_name, sheet_prefix, api_key_env
+    :return: Tenant
+    """
+    missing = [key for key in ('name', 'spread_name', 'sheet_prefix', 'api_key_env') if not data.get(key)]
+    if missing:
+        raise ValueError(f"Арендатор {data.get('name', '?')}: не заданы {', '.join(missing)}")
+    if data['name'] == DEFAULT_TENANT:
+        # Под этим именем работает арендатор из основных настроек Config: общий клиент Close,
+        # ключ CLOSE_API_KEY_ENV и файлы без суффикса
+        raise ValueError(f"Имя арендатора {DEFAULT_TENANT} зарезервировано для режима одной команды")
+    unknown = set(data) - {f.name for f in fields(Tenant)}
+    if unknown:
+        raise ValueError(f"Арендатор {data['name']}: неизвестные параметры {', '.join(sorted(unknown))}")
+    name = data['name']
+    return Tenant(
+        name=name,
+        spread_name=data['spread_name'],
+        sheet_prefix=data['sheet_prefix'],
+        api_key_env=data['api_key_env'],
+        schedule_cron=data.get('schedule_cron', Config.SCHEDULE_CRON),
+        timezone=data.get('timezone', Config.TIMEZONE),
+        holidays=tuple(data.get('holidays', Config.HOLIDAYS)),
+        report_spread_name=data.get('report_spread_name'),
+        rate_limit_rps=data.get('rate_limit_rps', Config.RATE_LIMIT_RPS),
+        rate_limit_burst=data.get('rate_limit_burst', Config.RATE_LIMIT_BURST),
+        max_mailbox_workers=data.get('max_mailbox_workers', Config.MAX_MAILBOX_WORKERS),
+        journal_dir=data.get('journal_dir', os.path.join(Config.JOURNAL_DIR, name)),
+        search_cache_db=data.get('search_cache_db', _suffixed(Config.SEARCH_CACHE_DB, name)),
+        sheet_cache_db=data.get('sheet_cache_db', _suffixed(Config.SHEET_CACHE_DB, name)),
+        history_db=data.get('history_db', _suffixed(Config.HISTORY_DB, name)),
+        state_file=data.get('state_file', _suffixed(Config.SCHEDULER_STATE_FILE, name)),
+    )
+
+
+def load_tenants(entries=None):
+    """
+    Список арендаторов из Config.TENANTS, при пустом списке - один арендатор по умолчанию
+    :return: список Tenant
+    """
+    entries = Config.TENANTS if entries is None else entries
+    if not entries:
+        return [default_tenant()]
+    tenants = [tenant_from_dict(entry) for entry in entries]
+    names = [tenant.name for tenant in tenants]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Повторяющиеся имена арендаторов: {', '.join(duplicates)}")
+    return tenants
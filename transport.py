@@ -0,0 +1,178 @@
+import re
+import time
+import random
+import threading
+import requests
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from closeio_api import Client, APIError, ValidationError
+from config import Config
+from metrics import API_REQUEST_SECONDS, API_RESPONSES, API_RETRIES, endpoint_label, timed
+
+RATE_LIMIT_HEADER_RE = re.compile(r"limit=(\d+), remaining=(\d+), reset=(\d+(?:\.\d+)?)")
+
+
+class TokenBucket:
+    """Потокобезопасный token bucket: rate токенов в секунду, не более capacity подряд"""
+
+    def __init__(self, rate, capacity, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Берет токен, если он доступен
+        :return: 0, если токен получен, иначе сколько секунд подождать до следующей попытки
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if self._tokens >= 1 - 1e-9:
+                self._tokens = max(0.0, self._tokens - 1)
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Блокирует поток, пока не будет доступен токен"""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self.sleep(wait)
+
+    def pause(self, seconds):
+        """Останавливает выдачу токенов всем потокам на seconds секунд (ответ 429 или исчерпанная квота)"""
+        with self._lock:
+            now = self.clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0.0
+            self._updated = now
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Экспоненциальная задержка с полным джиттером для попытки attempt (с нуля)"""
+    base = Config.BACKOFF_BASE if base is None else base
+    cap = Config.BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def rate_limit_wait(response):
+    """
+    Определяет по заголовкам ответа, сколько секунд нужно подождать
+    :param response: requests.Response
+    :return: секунды ожидания или None, если заголовки не требуют паузы
+    """
+    headers = response.headers
+    match = RATE_LIMIT_HEADER_RE.search(headers.get('RateLimit', ''))
+    if match:
+        limit, remaining, reset = match.groups()
+        if response.status_code == 429 or int(remaining) == 0:
+            return float(reset)
+        return None
+
+    # Время сброса квоты важно, только если квота исчерпана; иначе пауза остановила бы все потоки зря
+    if response.status_code != 429 and headers.get('RateLimit-Remaining') != '0':
+        return None
+
+    for header in ('Retry-After', 'RateLimit-Reset'):
+        value = headers.get(header)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                continue
+
+    if response.status_code == 429:
+        return backoff_delay(0)
+    return None
+
+
+def request_not_sent(error):
+    """
+    Ошибка requests произошла до отправки запроса (соединение не установлено).
+    После таймаута чтения или обрыва соединения Close мог уже выполнить запрос
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.Timeout) or not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class RateLimitedClient(Client):
+    """
+    Клиент Close API с общим ограничением скорости.
+    Все запросы проходят через token bucket, ответы 429 и исчерпанная квота из заголовков
+    приостанавливают bucket для всех потоков, временные ошибки повторяются
+    с экспоненциальной задержкой и джиттером.
+    """
+
+    # Повторяются только ответы, не меняющие данные на стороне Close
+    RETRY_STATUSES = (503,)
+    RETRY_GET_STATUSES = (500, 502, 503, 504)
+
+    def __init__(self, api_key=None, bucket=None, max_attempts=None, timeout=None, sleep=time.sleep):
+        super().__init__(api_key)
+        self.bucket = bucket or TokenBucket(Config.RATE_LIMIT_RPS, Config.RATE_LIMIT_BURST)
+        self.max_attempts = max_attempts or Config.MAX_RETRIES
+        self.timeout = timeout or Config.API_TIMEOUT
+        self.sleep = sleep
+
+    def _dispatch(self, method_name, endpoint, api_key=None, data=None,
+                  debug=False, timeout=None, **kwargs):
+        prepped_req = self._prepare_request(method_name, endpoint, api_key,
+                                            data, debug, **kwargs)
+        timeout = timeout or self.timeout
+        label = endpoint_label(endpoint)
+
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                with timed(API_REQUEST_SECONDS, method=method_name, endpoint=label):
+                    response = self.session.send(prepped_req, verify=self.verify, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                attempt += 1
+                # Изменяющие запросы (подписка) повторяются, только если точно не были отправлены
+                if attempt >= self.max_attempts or (method_name != 'get' and not request_not_sent(e)):
+                    raise
+                API_RETRIES.inc(endpoint=label, reason=type(e).__name__)
+                self.sleep(backoff_delay(attempt - 1))
+                continue
+            API_RESPONSES.inc(endpoint=label, status=response.status_code)
+
+            wait = rate_limit_wait(response)
+            if wait is not None:
+                self.bucket.pause(wait)
+
+            retry_statuses = self.RETRY_GET_STATUSES if method_name == 'get' else self.RETRY_STATUSES
+            if response.status_code == 429 or response.status_code in retry_statuses:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    break
+                API_RETRIES.inc(endpoint=label, reason=response.status_code)
+                if response.status_code != 429:
+                    self.sleep(backoff_delay(attempt - 1))
+                continue
+            break
+
+        if response.ok:
+            if response.status_code == 204:
+                return ''
+            return response.json()
+        elif response.status_code == 400:
+            raise ValidationError(response)
+        else:
+            raise APIError(response)